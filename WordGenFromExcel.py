@@ -1,141 +1,840 @@
+import io
 import os
 import sys
-import subprocess
+import re
+import time
+import copy
+import csv
+import codecs
+import json
+import shutil
+import hashlib
+import zlib
+import struct
+import zipfile
+import argparse
+import logging
+import cProfile
+import functools
+import multiprocessing
+import queue
+import threading
 from pathlib import Path
-from docx import Document
-import openpyxl
-from datetime import datetime
+from bisect import bisect_left, bisect_right
+from collections import Counter, OrderedDict, deque
+from contextlib import contextmanager
+from itertools import accumulate, chain
+from datetime import datetime, date
 import configparser
 
+# python-docx, lxml и openpyxl импортируются внутри функций, при первом обращении:
+# запуск (особенно собранного PyInstaller exe) и проверка ini-файла не ждут их загрузки.
+
+
+def compile_placeholders(placeholders):
+    """
+    Собирает одно регулярное выражение, находящее любой из плейсхолдеров.
+    Длинные плейсхолдеры стоят первыми, чтобы «Сумма» не перехватывала «Сумма прописью».
+    """
+    unique = sorted({p for p in placeholders if p}, key=len, reverse=True)
+    if not unique:
+        return None
+    return re.compile('|'.join(re.escape(p) for p in unique))
+
+
+def replace_placeholders_in_paragraph(paragraph, pattern, values, counts=None):
+    """
+    Заменяет все плейсхолдеры в одном параграфе за один просмотр его текста.
+    pattern — результат compile_placeholders(), values — словарь плейсхолдер → значение.
+    В counts (Counter), если он передан, накапливается число замен по плейсхолдерам.
+    Поведение имитирует Microsoft Word.
+
+    Работа линейна по числу run'ов и вхождений: границы run'ов ищутся
+    бинарным поиском по префиксным суммам длин, а все правки применяются
+    за один проход справа налево.
+    """
+    runs = paragraph.runs
+    # Защита от пустого набора плейсхолдеров или пустого параграфа
+    if pattern is None or not runs:
+        return
+
+    # Текст каждого run'а читается из XML один раз
+    texts = [run.text for run in runs]
+    full_text = ''.join(texts)
+
+    matches = list(pattern.finditer(full_text))
+    if not matches:
+        return
+
+    # starts[i] — позиция начала run i в full_text
+    starts = list(accumulate((len(text) for text in texts[:-1]), initial=0))
+    # Индексы run'ов, текст которых нужно записать обратно в XML
+    changed = set()
+
+    # Правки идут справа налево: замена не сдвигает позиции левее себя,
+    # поэтому starts остаётся верным для всех ещё не обработанных вхождений
+    for match in reversed(matches):
+        old_text = match.group(0)
+        new_text = values[old_text]
+        # Начало и конец заменяемого фрагмента (конец не включительно)
+        pos, end_pos = match.span()
+
+        # Первый run, содержащий pos, и последний run, начинающийся до end_pos.
+        # Пустые run'ы на границах не считаются затронутыми.
+        first_idx = bisect_right(starts, pos) - 1
+        last_idx = bisect_left(starts, end_pos) - 1
+
+        # Текст ДО плейсхолдера в первом run и ПОСЛЕ него в последнем run
+        before = texts[first_idx][:pos - starts[first_idx]]
+        after = texts[last_idx][end_pos - starts[last_idx]:]
+
+        # === Главное действие: замена текста ===
+        if first_idx == last_idx:
+            # Замена происходит внутри одного run
+            texts[first_idx] = before + new_text + after
+        else:
+            # Замена охватывает несколько run'ов: новый текст получает оформление первого
+            texts[first_idx] = before + new_text
+            texts[last_idx] = after
+            changed.add(last_idx)
+            # Удаляем промежуточные run (между first и last)
+            for idx in range(last_idx - 1, first_idx, -1):
+                paragraph._element.remove(runs[idx]._element)
+        changed.add(first_idx)
+
+        if counts is not None:
+            counts[old_text] += 1
+
+    # Каждый изменённый run перезаписывается в XML ровно один раз
+    for idx in changed:
+        runs[idx].text = texts[idx]
+
 
 def replace_in_paragraph(paragraph, old_text, new_text):
     """
     Заменяет все вхождения old_text на new_text в одном параграфе.
     Поведение имитирует Microsoft Word.
     """
-    # Защита от пустого old_text или пустого параграфа
-    if not old_text or not paragraph.runs:
+    # Защита от пустого old_text
+    if not old_text:
         return
+    replace_placeholders_in_paragraph(
+        paragraph, compile_placeholders([old_text]), {old_text: new_text}
+    )
 
-    # Объединяем текст всех run'ов параграфа в одну строку для поиска
-    full_text = ''.join(run.text for run in paragraph.runs)
 
-    # Если искомого текста нет — выходим
-    if old_text not in full_text:
-        return
+# Теги WordprocessingML, как их возвращает qn('w:...') из python-docx
+W_NS = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+W_P = f'{{{W_NS}}}p'
+W_T = f'{{{W_NS}}}t'
+W_R = f'{{{W_NS}}}r'
+W_RPR = f'{{{W_NS}}}rPr'
+W_BODY = f'{{{W_NS}}}body'
+W_SECT_PR = f'{{{W_NS}}}sectPr'
 
-    # Начинаем поиск с позиции 0
-    start_search = 0
+# Типы частей .docx, в которых бывает текст: основная часть, колонтитулы, сноски
+WML_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.wordprocessingml.%s+xml'
+WML_FOOTNOTES = WML_CONTENT_TYPE % 'footnotes'
+WML_ENDNOTES = WML_CONTENT_TYPE % 'endnotes'
+STORY_CONTENT_TYPES = frozenset((
+    WML_CONTENT_TYPE % 'document.main', WML_CONTENT_TYPE % 'header', WML_CONTENT_TYPE % 'footer',
+    WML_FOOTNOTES, WML_ENDNOTES,
+))
 
-    # будем искать все вхождения по очереди
-    while True:
-        # Ищем позицию первого вхождения old_text, начиная с start_search
-        pos = full_text.find(old_text, start_search)
 
-        # Если больше нет вхождений — выходим из цикла
-        if pos == -1:
-            break
+def open_docx(source):
+    """Открывает .docx (путь или файловый объект) через python-docx"""
+    from docx import Document
+    from docx.opc.part import PartFactory, XmlPart
 
-        # Конец заменяемого фрагмента (не включительно)
-        end_pos = pos + len(old_text)
-        # Получаем актуальный список run'ов (он может меняться при удалении)
-        runs = paragraph.runs
-        # current_offset — текущая позиция в full_text, соответствующая началу текущего run
-        current_offset = 0
-        # Список для хранения информации о run'ах, затронутых заменой:
-        # каждый элемент: (индекс_run, начало_сегмента_в_run, конец_сегмента_в_run)
-        affected_runs = []
-
-        # Проходим по всем run'ам, чтобы понять, какие из них пересекаются с [pos, end_pos)
-        for i, run in enumerate(runs):
-            run_len = len(run.text)
-            run_start = current_offset          # позиция начала этого run в full_text
-            run_end = current_offset + run_len  # позиция конца этого run в full_text
-
-            # Проверяем, пересекается ли этот run с заменяемым фрагментом
-            if run_end <= pos or run_start >= end_pos:
-                pass # Run полностью до или после заменяемого фрагмента — пропускаем
-            else:
-                # Этот run частично или полностью входит в заменяемый фрагмент
-
-                # Где внутри run начинается заменяемый фрагмент?
-                seg_start = max(0, pos - run_start)
-                # Где внутри run заканчивается заменяемый фрагмент?
-                seg_end = min(run_len, end_pos - run_start)
-                # Сохраняем информацию об этом run
-                affected_runs.append((i, seg_start, seg_end))
-            # Сдвигаем offset на длину текущего run
-            current_offset = run_end
-
-        # Если по какой-то причине не нашли затронутые run — пропускаем это вхождение
-        if not affected_runs:
-            start_search = pos + 1
-            continue
+    # Сноски python-docx по умолчанию хранит как двоичные данные — загружаем их как XML
+    for content_type in (WML_FOOTNOTES, WML_ENDNOTES):
+        PartFactory.part_type_for.setdefault(content_type, XmlPart)
+    return Document(source)
 
-        # Определяем первый и последний затронутые run
-        first_idx = affected_runs[0][0]   # индекс первого run, где начинается old_text
-        last_idx = affected_runs[-1][0]   # индекс последнего run, где заканчивается old_text
 
-        # === Часть 1: текст ДО old_text в первом run ===
-        # Берём всё, что в первом run идёт до начала old_text
-        before = runs[first_idx].text[:affected_runs[0][1]]
-         # === Часть 2: текст ПОСЛЕ old_text в последнем run ===
-        # Берём всё, что в последнем run идёт после конца old_text
-        after = runs[last_idx].text[affected_runs[-1][2]:]
+def story_parts(doc):
+    """Части документа, в которых бывает текст; основная часть идёт первой"""
+    parts = [
+        part for part in doc.part.package.iter_parts()
+        if part.content_type in STORY_CONTENT_TYPES
+    ]
+    return sorted(parts, key=lambda part: (part is not doc.part, str(part.partname)))
 
-        # === Главное действие: замена текста ===
-        # В ПЕРВОМ затронутом run оставляем "до" + новый текст
-        runs[first_idx].text = before + new_text
 
-        # Обновляем последний run, если он не первый
-        if first_idx != last_idx:
-            runs[last_idx].text = after
+def _paragraph_texts(element):
+    """Текст всех параграфов XML-части, по строке на параграф"""
+    return "\n".join(
+        ''.join(t.text or '' for t in p.iter(W_T)) for p in element.iter(W_P)
+    )
+
+
+def find_paragraph_slots(element, placeholders):
+    """
+    Один проход по всем w:p XML-части: таблицы любой вложенности, надписи, сноски.
+    Возвращает список (номер w:p в части, [индексы плейсхолдеров, найденных в его run'ах]).
+    """
+    from docx.text.paragraph import Paragraph
+
+    slots = []
+    for pos, p in enumerate(element.iter(W_P)):
+        text = ''.join(run.text for run in Paragraph(p, None).runs)
+        found = [
+            idx for idx, placeholder in enumerate(placeholders)
+            if placeholder and placeholder in text
+        ]
+        if found:
+            slots.append((pos, found))
+    return slots
+
 
-        # Удаляем промежуточные run (между first и last)
-        for idx in range(last_idx - 1, first_idx, -1):
-            paragraph._element.remove(runs[idx]._element)
+def iter_doc_paragraphs(doc):
+    """Перебирает все параграфы документа во всех частях с текстом, на любой глубине вложенности"""
+    from docx.text.paragraph import Paragraph
 
-        # Обновляем для следующей итерации
-        runs = paragraph.runs
-        full_text = ''.join(run.text for run in runs)
-        # Сдвигаем позицию поиска за пределы только что заменённого фрагмента
-        start_search = pos + len(new_text)
-        # Защита от бесконечного цикла, если old_text == new_text
-        if old_text == new_text:
-            start_search += 1
+    for part in story_parts(doc):
+        for p in part.element.iter(W_P):
+            yield Paragraph(p, None)
 
 
 def replace_text_in_doc(doc, old_text, new_text):
     """Заменяет текст во всех элементах документа"""
-    for paragraph in doc.paragraphs:
+    for paragraph in iter_doc_paragraphs(doc):
         replace_in_paragraph(paragraph, old_text, new_text)
 
-    for table in doc.tables:
-        for row in table.rows:
-            for cell in row.cells:
-                for paragraph in cell.paragraphs:
-                    replace_in_paragraph(paragraph, old_text, new_text)
-                for nested_table in cell.tables:
-                    for nested_row in nested_table.rows:
-                        for nested_cell in nested_row.cells:
-                            for nested_paragraph in nested_cell.paragraphs:
-                                replace_in_paragraph(nested_paragraph, old_text, new_text)
+
+def replace_placeholders_in_doc(doc, values):
+    """
+    Заменяет все плейсхолдеры из словаря values за один обход документа.
+    Возвращает Counter с числом замен по каждому плейсхолдеру.
+    """
+    pattern = compile_placeholders(values)
+    counts = Counter()
+    for paragraph in iter_doc_paragraphs(doc):
+        replace_placeholders_in_paragraph(paragraph, pattern, values, counts)
+    return counts
+
+
+class CompiledTemplate:
+    """
+    Шаблон, разобранный один раз на весь запуск.
+
+    Файл .docx распаковывается и разбирается только при создании объекта,
+    после подготовки normalize_template(): плейсхолдер, который Word разрезал
+    на run'ы с одинаковым оформлением, оказывается в одном run'е.
+    Один проход по XML всех частей с текстом (основная часть, колонтитулы,
+    сноски; таблицы любой вложенности и надписи) даёт список параграфов
+    с плейсхолдерами, который затем используется для каждой строки.
+    Для каждой строки Excel new_document() возвращает свежую копию
+    изменяемых частей из памяти.
+
+    Пробная замена при создании даёт индекс для проверки документов:
+    expected — сколько раз каждый плейсхолдер должен быть заменён,
+    unreplaced — плейсхолдеры, которые останутся в тексте при любых значениях.
+    template_path — путь к файлу .docx или его содержимое (bytes).
+    С кэшем cache (TemplateDiskCache) подготовленный шаблон и результаты разбора
+    берутся с диска, если этот шаблон с теми же плейсхолдерами уже разбирался.
+    """
+
+    def __init__(self, template_path, placeholders=(), cache=None):
+        self.template_path = template_path
+        self.placeholders = list(placeholders)
+        self.pattern = compile_placeholders(self.placeholders)
+        entry = None
+        if cache is not None:
+            content = read_template(template_path)
+            entry = cache.load(content, self.placeholders, 'docx')
+        if entry is not None:
+            self._load(*entry)
+            return
+        normalized = normalize_template(template_path)
+        self._compile(normalized)
+        if cache is not None:
+            cache.store(content, self.placeholders, 'docx', normalized, self._index(), template_label(template_path))
+
+    def _compile(self, normalized):
+        self._doc = open_docx(io.BytesIO(normalized))
+        # Части, которые копируются для каждой строки: с плейсхолдерами и основная
+        # (её может менять и внешний код, например docx_replace)
+        self._parts = []
+        # Список (номер части, номер w:p в части, [индексы плейсхолдеров в параграфе])
+        self.slots = []
+        for part in story_parts(self._doc):
+            slots = find_paragraph_slots(part.element, self.placeholders)
+            if slots or part is self._doc.part:
+                part_idx = len(self._parts)
+                self._parts.append(part)
+                self.slots.extend((part_idx, pos, found) for pos, found in slots)
+        # Нетронутые копии XML, из которых делаются копии для каждой строки
+        self._pristine = [copy.deepcopy(part.element) for part in self._parts]
+
+        # Пробная замена: единственное извлечение полного текста за весь запуск
+        doc = self.new_document()
+        self.expected = self.fill(doc, dict.fromkeys(self.placeholders, "-"))
+        doc_text = get_document_text(doc)
+        self.unreplaced = [ph for ph in self.placeholders if ph in doc_text]
+
+    def _index(self):
+        """Результаты разбора для TemplateDiskCache"""
+        return {
+            'parts': [str(part.partname) for part in self._parts],
+            'slots': self.slots,
+            'expected': self.expected,
+            'unreplaced': self.unreplaced,
+        }
+
+    def _load(self, normalized, index):
+        """Восстанавливает шаблон по записи TemplateDiskCache без поиска параграфов и пробной замены"""
+        self._doc = open_docx(io.BytesIO(normalized))
+        parts = {str(part.partname): part for part in story_parts(self._doc)}
+        self._parts = [parts[name] for name in index['parts']]
+        self.slots = [(part_idx, pos, found) for part_idx, pos, found in index['slots']]
+        self._pristine = [copy.deepcopy(part.element) for part in self._parts]
+        self.expected = Counter(index['expected'])
+        self.unreplaced = index['unreplaced']
+
+    def new_document(self):
+        """Возвращает новый документ, равный исходному шаблону"""
+        for part, element in zip(self._parts, self._pristine):
+            part._element = copy.deepcopy(element)
+        return self._doc.part.document
+
+    def paragraphs(self, doc):
+        """Возвращает пары (параграф, индексы плейсхолдеров) для документа из new_document()"""
+        from docx.text.paragraph import Paragraph
+
+        elements = {}
+        paragraphs = []
+        for part_idx, pos, found in self.slots:
+            if part_idx not in elements:
+                elements[part_idx] = list(self._parts[part_idx].element.iter(W_P))
+            paragraphs.append((Paragraph(elements[part_idx][pos], None), found))
+        return paragraphs
+
+    def fill(self, doc, values):
+        """
+        Подставляет значения в документ из new_document(), просматривая каждый
+        параграф с плейсхолдерами один раз. Возвращает Counter числа замен.
+        """
+        counts = Counter()
+        for paragraph, _ in self.paragraphs(doc):
+            replace_placeholders_in_paragraph(paragraph, self.pattern, values, counts)
+        return counts
+
+    def missing(self, counts):
+        """Плейсхолдеры, оставшиеся в документе после fill(), по счётчику замен counts"""
+        return [
+            ph for ph in self.placeholders
+            if ph in self.unreplaced or counts[ph] < self.expected[ph]
+        ]
+
+
+# Формат локального заголовка записи zip (без имени файла и дополнительного поля)
+ZIP_LOCAL_HEADER = struct.Struct('<4s5H3L2H')
+
+
+def _read_raw_member(fp, info):
+    """Читает сжатые данные записи архива как есть, без распаковки"""
+    fp.seek(info.header_offset)
+    header = ZIP_LOCAL_HEADER.unpack(fp.read(ZIP_LOCAL_HEADER.size))
+    name_length, extra_length = header[-2:]
+    fp.seek(info.header_offset + ZIP_LOCAL_HEADER.size + name_length + extra_length)
+    return fp.read(info.compress_size)
+
+
+# Внутреннее состояние zipfile.ZipFile, которое меняет _write_raw_member()
+ZIPFILE_STATE = ('fp', 'start_dir', 'filelist', 'NameToInfo', '_didModify')
+
+
+def _inflate_member(info, raw):
+    """Распаковывает данные записи, прочитанные _read_raw_member()"""
+    if info.compress_type == zipfile.ZIP_STORED:
+        return raw
+    if info.compress_type == zipfile.ZIP_DEFLATED:
+        return zlib.decompress(raw, -zlib.MAX_WBITS)
+    raise ValueError(f"Запись {info.filename}: неподдерживаемое сжатие {info.compress_type}")
+
+
+def _write_raw_member(zout, info, raw):
+    """
+    Дописывает в архив уже сжатую запись без повторного сжатия.
+    zipfile не умеет этого напрямую, поэтому заголовок пишется вручную,
+    а запись регистрируется в оглавлении архива так же, как это делает writestr().
+    Если в этой версии Python у ZipFile нет нужного внутреннего состояния,
+    запись распаковывается и сжимается заново через writestr().
+    """
+    zinfo = copy.copy(info)
+    if not all(hasattr(zout, name) for name in ZIPFILE_STATE):
+        zout.writestr(zinfo, _inflate_member(info, raw))
+        return
+    # CRC и размеры известны заранее и пишутся в заголовок, а не после данных
+    zinfo.flag_bits &= ~0x08
+    zout.fp.seek(zout.start_dir)
+    zinfo.header_offset = zout.fp.tell()
+    zout.fp.write(zinfo.FileHeader())
+    zout.fp.write(raw)
+    zout.start_dir = zout.fp.tell()
+    zout.filelist.append(zinfo)
+    zout.NameToInfo[zinfo.filename] = zinfo
+    zout._didModify = True
+
+
+def xml_escape(text):
+    """Экранирует &, < и > для вставки текста в XML (как xml.sax.saxutils.escape, без импорта urllib)"""
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+
+def _is_plain_value(value):
+    """Значение можно вставить прямо в w:t без python-docx: без переносов, табуляций и краевых пробелов"""
+    return value == value.strip() and not any(ord(char) < 32 for char in value)
+
+
+def _zip_content_types(zin):
+    """Тип содержимого каждой записи архива по [Content_Types].xml"""
+    from docx.oxml import parse_xml
+    from lxml import etree
+
+    defaults = {}
+    overrides = {}
+    for element in parse_xml(zin.read('[Content_Types].xml')):
+        if not isinstance(element.tag, str):
+            continue
+        tag = etree.QName(element).localname
+        if tag == 'Default':
+            defaults[element.get('Extension').lower()] = element.get('ContentType')
+        elif tag == 'Override':
+            overrides[element.get('PartName').lstrip('/')] = element.get('ContentType')
+    return {
+        info.filename: overrides.get(
+            info.filename, defaults.get(info.filename.rsplit('.', 1)[-1].lower())
+        )
+        for info in zin.infolist()
+    }
+
+
+# Разметка, которую Word добавляет при правке и проверке правописания; на вид документа не влияет.
+# Из-за неё плейсхолдер, набранный одним словом, оказывается разрезан на несколько run'ов.
+NOISE_TAGS = tuple(f'{{{W_NS}}}{tag}' for tag in ('proofErr', 'lastRenderedPageBreak'))
+RSID_ATTRIBUTES = frozenset(
+    f'{{{W_NS}}}{name}'
+    for name in ('rsidR', 'rsidRPr', 'rsidRDefault', 'rsidP', 'rsidDel', 'rsidSect', 'rsidTr')
+)
+XML_SPACE = '{http://www.w3.org/XML/1998/namespace}space'
+# Сколько подготовленных шаблонов хранить в памяти процесса
+NORMALIZED_CACHE_SIZE = 8
+
+_normalized_templates = OrderedDict()
+_normalized_lock = threading.Lock()
+
+
+def _text_run_key(element):
+    """
+    Оформление run'а, в котором только текст: (атрибуты, w:rPr в виде XML).
+    None для всего остального — такие run'ы и элементы не склеиваются.
+    """
+    from lxml import etree
+
+    if element.tag != W_R:
+        return None
+    children = list(element)
+    rpr = b''
+    if children and children[0].tag == W_RPR:
+        rpr = etree.tostring(children.pop(0))
+    if len(children) != 1 or children[0].tag != W_T:
+        return None
+    return tuple(sorted(element.attrib.items())), rpr
+
+
+def normalize_story_element(element):
+    """
+    Удаляет из XML-части шумовую разметку (отметки правописания, атрибуты rsid)
+    и склеивает соседние run'ы с одинаковым w:rPr, в которых только текст.
+    Оформление текста не меняется. Возвращает число склеенных run'ов.
+    """
+    for noise in list(element.iter(*NOISE_TAGS)):
+        noise.getparent().remove(noise)
+    for node in element.iter():
+        for name in RSID_ATTRIBUTES.intersection(node.attrib):
+            del node.attrib[name]
+
+    merged = 0
+    for parent in {run.getparent() for run in element.iter(W_R)}:
+        previous_t = previous_key = None
+        for child in list(parent):
+            key = _text_run_key(child)
+            if key is None or key != previous_key:
+                previous_key = key
+                previous_t = child[-1] if key is not None else None
+                continue
+            text = (previous_t.text or '') + (child[-1].text or '')
+            previous_t.text = text
+            if text != text.strip():
+                previous_t.set(XML_SPACE, 'preserve')
+            parent.remove(child)
+            merged += 1
+    return merged
+
+
+def read_template(template):
+    """Содержимое шаблона: template — путь к файлу .docx или уже прочитанные bytes"""
+    if isinstance(template, (bytes, bytearray, memoryview)):
+        return bytes(template)
+    with open(template, 'rb') as f:
+        return f.read()
+
+
+def template_label(template):
+    """Имя шаблона для сообщений"""
+    if isinstance(template, (bytes, bytearray, memoryview)):
+        return f"из памяти ({len(template)} байт)"
+    return os.path.basename(template)
+
+
+def normalize_template(template_path):
+    """
+    Возвращает содержимое .docx, подготовленное normalize_story_element() во всех
+    частях с текстом; остальные записи архива копируются без пересжатия.
+    Результат хранится в памяти по SHA-256 содержимого файла: тот же шаблон
+    (в том числе под другим именем или с другими заголовками) готовится один раз.
+    template_path — путь к файлу или содержимое .docx (bytes).
+    """
+    from docx.opc.oxml import serialize_part_xml
+    from docx.oxml import parse_xml
+
+    content = read_template(template_path)
+    key = hashlib.sha256(content).hexdigest()
+    with _normalized_lock:
+        if key in _normalized_templates:
+            _normalized_templates.move_to_end(key)
+            return _normalized_templates[key]
+
+    merged = 0
+    fp = io.BytesIO(content)
+    output = io.BytesIO()
+    with zipfile.ZipFile(fp) as zin, zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED) as zout:
+        content_types = _zip_content_types(zin)
+        for info in zin.infolist():
+            if content_types[info.filename] in STORY_CONTENT_TYPES:
+                element = parse_xml(zin.read(info))
+                merged += normalize_story_element(element)
+                zout.writestr(
+                    zipfile.ZipInfo(info.filename, info.date_time), serialize_part_xml(element),
+                    compress_type=zipfile.ZIP_DEFLATED
+                )
+            else:
+                _write_raw_member(zout, info, _read_raw_member(fp, info))
+    normalized = output.getvalue()
+    logger.debug("Шаблон %s подготовлен: склеено run'ов %s", template_label(template_path), merged)
+
+    with _normalized_lock:
+        _normalized_templates[key] = normalized
+        while len(_normalized_templates) > NORMALIZED_CACHE_SIZE:
+            _normalized_templates.popitem(last=False)
+    return normalized
+
+
+class RawTemplate:
+    """
+    Шаблон для быстрого режима (--engine raw): .docx обрабатывается как zip-архив.
+
+    Части без плейсхолдеров (картинки, шрифты, стили) копируются в результат
+    в уже сжатом виде, без распаковки и повторного сжатия. В XML-частях с
+    плейсхолдерами текст заменяется напрямую: если каждый плейсхолдер целиком
+    лежит внутри одного w:t, часть заранее разрезается на куски и для строки
+    просто склеивается со значениями, иначе параграфы обрабатываются
+    тем же движком, что и в основном режиме. Шаблон предварительно
+    подготавливается normalize_template(), поэтому первый путь срабатывает чаще.
+    template_path — путь к файлу .docx или его содержимое (bytes), cache — как
+    у CompiledTemplate.
+    """
+
+    def __init__(self, template_path, placeholders=(), cache=None):
+        self.template_path = template_path
+        self.placeholders = list(placeholders)
+        self.pattern = compile_placeholders(self.placeholders)
+        entry = None
+        if cache is not None:
+            content = read_template(template_path)
+            entry = cache.load(content, self.placeholders, 'raw')
+        if entry is not None:
+            self._load(*entry)
+            return
+        normalized = normalize_template(template_path)
+        self._compile(normalized)
+        if cache is not None:
+            cache.store(content, self.placeholders, 'raw', normalized, self._index(), template_label(template_path))
+
+    def _compile(self, normalized):
+        # Записи архива по порядку: (ZipInfo, сжатые данные или None для изменяемой части)
+        self._members = []
+        # Изменяемые части: имя → (исходный XML, номера параграфов с плейсхолдерами)
+        self._parts = {}
+        # Части, разрезанные по плейсхолдерам: имя → [xml, плейсхолдер, xml, ...]
+        self._chunks = {}
+        leftovers = set()
+
+        from docx.oxml import parse_xml
+
+        fp = io.BytesIO(normalized)
+        with zipfile.ZipFile(fp) as zin:
+            content_types = _zip_content_types(zin)
+            for info in zin.infolist():
+                if self.pattern is not None and content_types[info.filename] in STORY_CONTENT_TYPES:
+                    element = parse_xml(zin.read(info))
+                    slots = self._find_slots(element)
+                    if slots:
+                        self._members.append((info, None))
+                        self._parts[info.filename] = (element, slots)
+                        chunks = self._split_into_chunks(element, slots)
+                        if chunks is not None:
+                            self._chunks[info.filename] = chunks
+                        # Пробная замена показывает, что останется незамененным в любой строке
+                        element = self._fill_element(element, slots, dict.fromkeys(self.placeholders, "-"))
+                    text = _paragraph_texts(element)
+                    leftovers.update(ph for ph in self.placeholders if ph in text)
+                    if slots:
+                        continue
+                self._members.append((info, _read_raw_member(fp, info)))
+
+        # Плейсхолдеры, которые этот режим не сможет заменить (например, внутри гиперссылок)
+        self.unreplaced = [ph for ph in self.placeholders if ph in leftovers]
+
+    def _index(self):
+        """Результаты разбора для TemplateDiskCache: изменяемые части, их параграфы и куски"""
+        return {
+            'parts': {
+                name: {'slots': slots, 'chunks': self._chunks.get(name)}
+                for name, (_, slots) in self._parts.items()
+            },
+            'unreplaced': self.unreplaced,
+        }
+
+    def _load(self, normalized, index):
+        """Восстанавливает шаблон по записи TemplateDiskCache без поиска параграфов и пробной замены"""
+        from docx.oxml import parse_xml
+
+        self._members = []
+        self._parts = {}
+        self._chunks = {}
+        fp = io.BytesIO(normalized)
+        with zipfile.ZipFile(fp) as zin:
+            for info in zin.infolist():
+                part = index['parts'].get(info.filename)
+                if part is None:
+                    self._members.append((info, _read_raw_member(fp, info)))
+                    continue
+                self._members.append((info, None))
+                self._parts[info.filename] = (parse_xml(zin.read(info)), part['slots'])
+                if part['chunks'] is not None:
+                    self._chunks[info.filename] = part['chunks']
+        self.unreplaced = index['unreplaced']
+
+    def _find_slots(self, element):
+        return [pos for pos, _ in find_paragraph_slots(element, self.placeholders)]
+
+    def _split_into_chunks(self, element, slots):
+        """
+        Разрезает сериализованную часть по плейсхолдерам, если это равносильно
+        замене по run'ам: каждое вхождение целиком внутри одного w:t
+        и ни одно не встречается вне параграфов из slots.
+        """
+        from docx.opc.oxml import serialize_part_xml
+        from docx.text.paragraph import Paragraph
+
+        paragraphs = list(element.iter(W_P))
+        in_runs = 0
+        for pos in slots:
+            runs = Paragraph(paragraphs[pos], None).runs
+            found = len(self.pattern.findall(''.join(run.text for run in runs)))
+            inside_t = sum(
+                len(self.pattern.findall(t.text or ''))
+                for run in runs for t in run._r.iter(W_T)
+            )
+            if found != inside_t:
+                return None
+            in_runs += found
+        in_all_t = sum(len(self.pattern.findall(t.text or '')) for t in element.iter(W_T))
+
+        escaped = {xml_escape(ph): ph for ph in self.placeholders if ph}
+        xml_pattern = re.compile(
+            '(' + '|'.join(re.escape(e) for e in sorted(escaped, key=len, reverse=True)) + ')'
+        )
+        chunks = xml_pattern.split(serialize_part_xml(element).decode('utf-8'))
+        if not in_runs == in_all_t == len(chunks) // 2:
+            return None
+        chunks[1::2] = [escaped[e] for e in chunks[1::2]]
+        return chunks
+
+    def _fill_element(self, element, slots, values, counts=None):
+        from docx.text.paragraph import Paragraph
+
+        element = copy.deepcopy(element)
+        paragraphs = list(element.iter(W_P))
+        for pos in slots:
+            replace_placeholders_in_paragraph(Paragraph(paragraphs[pos], None), self.pattern, values, counts)
+        return element
+
+    def render_parts(self, values, counts=None):
+        """
+        Возвращает {имя части: XML} для всех частей с плейсхолдерами.
+        Если передан Counter counts, в него добавляется число замен.
+        """
+        from docx.opc.oxml import serialize_part_xml
+
+        plain = all(_is_plain_value(value) for value in values.values())
+        parts = {}
+        for name, (element, slots) in self._parts.items():
+            chunks = self._chunks.get(name)
+            if chunks is not None and plain:
+                pieces = list(chunks)
+                pieces[1::2] = [xml_escape(values[ph]) for ph in chunks[1::2]]
+                parts[name] = ''.join(pieces).encode('utf-8')
+                if counts is not None:
+                    counts.update(chunks[1::2])
+            else:
+                parts[name] = serialize_part_xml(self._fill_element(element, slots, values, counts))
+        return parts
+
+    def save(self, values, file):
+        """Записывает документ со значениями values в файл (путь или файловый объект)"""
+        self.write(self.render_parts(values), file)
+
+    def write(self, parts, file):
+        """Собирает архив из частей render_parts() и неизменных записей шаблона"""
+        with zipfile.ZipFile(file, 'w', zipfile.ZIP_DEFLATED) as zout:
+            for info, raw in self._members:
+                if raw is None:
+                    zout.writestr(
+                        zipfile.ZipInfo(info.filename, info.date_time), parts[info.filename],
+                        compress_type=zipfile.ZIP_DEFLATED
+                    )
+                else:
+                    _write_raw_member(zout, info, raw)
+
 
 def get_document_text(doc):
-    """Извлекает весь текст документа для проверки замен"""
-    text = []
-    for paragraph in doc.paragraphs:
-        text.append(paragraph.text)
-
-    for table in doc.tables:
-        for row in table.rows:
-            for cell in row.cells:
-                text.append(cell.text)
-                for nested_table in cell.tables:
-                    for nested_row in nested_table.rows:
-                        for nested_cell in nested_row.cells:
-                            text.append(nested_cell.text)
-    return "\n".join(text)
+    """Извлекает весь текст документа для проверки замен: все части с текстом, любая вложенность"""
+    return "\n".join(_paragraph_texts(part.element) for part in story_parts(doc))
+
+
+# Версия формата записей TemplateDiskCache: увеличивается при любом изменении разбора шаблонов
+TEMPLATE_CACHE_VERSION = 1
+# Предельный общий размер кэша шаблонов на диске, байт
+TEMPLATE_CACHE_MAX_BYTES = 200 * 2 ** 20
+
+
+def default_template_cache_dir():
+    """Каталог кэша шаблонов по умолчанию: в локальных данных пользователя, общий для всех папок"""
+    base = os.environ.get('LOCALAPPDATA') or os.environ.get('XDG_CACHE_HOME') \
+        or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'WordGenFromExcel', 'templates')
+
+
+class TemplateDiskCache:
+    """
+    Разобранные шаблоны на диске между запусками (--template-cache).
+
+    Запись — шаблон, подготовленный normalize_template(), и результаты разбора
+    в JSON: части с плейсхолдерами, номера их параграфов, позиции плейсхолдеров
+    и итог пробной замены. Ключ — SHA-256 содержимого шаблона, плейсхолдеры
+    (заголовки из первой строки Excel), способ замены и версии формата и python-docx:
+    изменённый шаблон или другие заголовки дают новую запись, а не устаревшую.
+    Когда общий размер превышает max_bytes, удаляются давно не использованные записи.
+    Повреждённая запись считается отсутствующей, ошибка записи только попадает в журнал.
+    """
+
+    def __init__(self, directory, max_bytes=TEMPLATE_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def _paths(self, content, placeholders, kind):
+        from docx import __version__ as docx_version
+
+        key = data_sha256([
+            TEMPLATE_CACHE_VERSION, docx_version, kind, hashlib.sha256(content).hexdigest(), list(placeholders)
+        ])
+        base = os.path.join(self.directory, key)
+        return base + '.docx', base + '.json'
+
+    def load(self, content, placeholders, kind):
+        """Возвращает (подготовленный шаблон, результаты разбора) или None, если записи нет"""
+        docx_path, index_path = self._paths(content, placeholders, kind)
+        try:
+            with open(index_path, encoding='utf-8') as f:
+                index = json.load(f)
+            with open(docx_path, 'rb') as f:
+                normalized = f.read()
+            if hashlib.sha256(normalized).hexdigest() != index['normalized_sha256']:
+                raise ValueError("содержимое не совпадает с индексом")
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError) as e:
+            logger.debug("Запись кэша шаблонов %s пропущена: %s", index_path, e)
+            return None
+        # Время изменения — время последнего использования: по нему вытесняются записи
+        for path in (docx_path, index_path):
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+        logger.debug("Шаблон %s загружен из кэша %s", index['template'], self.directory)
+        return normalized, index['index']
+
+    def store(self, content, placeholders, kind, normalized, index, name):
+        """
+        Сохраняет запись для шаблона name. Индекс записывается последним,
+        поэтому недописанная запись не читается.
+        """
+        docx_path, index_path = self._paths(content, placeholders, kind)
+        entry = {
+            'template': name,
+            'normalized_sha256': hashlib.sha256(normalized).hexdigest(),
+            'index': index,
+        }
+        files = ((docx_path, normalized), (index_path, json.dumps(entry, ensure_ascii=False).encode('utf-8')))
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            for path, data in files:
+                tmp_path = f"{path}.{os.getpid()}.tmp"
+                with open(tmp_path, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+            self.evict()
+        except OSError as e:
+            logger.warning("Не удалось сохранить шаблон в кэш %s: %s", self.directory, e)
+
+    def evict(self):
+        """Удаляет давно не использованные записи, пока кэш больше max_bytes"""
+        entries = {}
+        with os.scandir(self.directory) as it:
+            for item in it:
+                key, ext = os.path.splitext(item.name)
+                if ext in ('.docx', '.json') and item.is_file():
+                    stat = item.stat()
+                    size, used = entries.get(key, (0, 0))
+                    entries[key] = (size + stat.st_size, max(used, stat.st_mtime))
+        total = sum(size for size, _ in entries.values())
+        for key, (size, _) in sorted(entries.items(), key=lambda item: item[1][1]):
+            if total <= self.max_bytes:
+                break
+            for ext in ('.json', '.docx'):
+                try:
+                    os.remove(os.path.join(self.directory, key + ext))
+                except FileNotFoundError:
+                    pass
+            total -= size
+            logger.debug("Из кэша шаблонов удалена запись %s", key)
+
+
+# Расширения файла данных, для каждого есть источник строк в ROW_SOURCES
+DATA_FILE_SUFFIXES = ('.xlsx', '.csv', '.jsonl')
+# Разделители, среди которых выбирается разделитель CSV
+CSV_DELIMITERS = (';', ',', '\t')
+
+
+def format_suffixes():
+    return ', '.join(DATA_FILE_SUFFIXES[:-1]) + ' или ' + DATA_FILE_SUFFIXES[-1]
+
 
 def load_config():
     """Загружает конфигурацию из INI файла с валидацией значений."""
@@ -151,121 +850,2211 @@ def load_config():
         config.read(config_file_path, encoding='utf-8')
         template_name = config.get('PATHS', 'template_name')
         data_file_name = config.get('PATHS', 'data_file_name')
+        validate_paths(template_name, data_file_name)
+        return template_name, data_file_name
+
+    except Exception as e:
+        config_error(e)
 
-        # валидация
-        if not template_name or not isinstance(template_name, str):
-            raise ValueError("Название файла шаблона договора в ini файле указано не корректно")
-        if not data_file_name or not isinstance(data_file_name, str):
-            raise ValueError("Название файла эксел с данными в ini файле указано не корректно")
-        if not template_name.lower().endswith('.docx'):
-            raise ValueError("Название файла с шаблоном договора должен оканчиваться на .docx")
-        if not data_file_name.lower().endswith('.xlsx'):
-            raise ValueError("Название файла с данными экселе должен оканчиваться на .xlsx")
-        if not os.path.exists(os.path.join(os.getcwd(), template_name)):
-            raise ValueError(f"Не найден файл шаблона договора - {template_name}")
-        if not os.path.exists(os.path.join(os.getcwd(), data_file_name)):
-            raise ValueError(f"Не найден файл эксел с данными - {data_file_name}")
 
-        return template_name, data_file_name
+def validate_paths(template_name, data_file_name):
+    """Проверяет имена файлов шаблона и данных из ini-файла"""
+    if not template_name or not isinstance(template_name, str):
+        raise ValueError("Название файла шаблона договора в ini файле указано не корректно")
+    if not data_file_name or not isinstance(data_file_name, str):
+        raise ValueError("Название файла эксел с данными в ini файле указано не корректно")
+    if not template_name.lower().endswith('.docx'):
+        raise ValueError("Название файла с шаблоном договора должен оканчиваться на .docx")
+    if not data_file_name.lower().endswith(DATA_FILE_SUFFIXES):
+        raise ValueError("Название файла с данными должно оканчиваться на " + format_suffixes())
+    if not os.path.exists(os.path.join(os.getcwd(), template_name)):
+        raise ValueError(f"Не найден файл шаблона договора - {template_name}")
+    if not os.path.exists(os.path.join(os.getcwd(), data_file_name)):
+        raise ValueError(f"Не найден файл эксел с данными - {data_file_name}")
+
+
+def config_error(error):
+    """Сообщает об ошибке в ini-файле и завершает программу"""
+    print(f"Ошибка: {error}.")
+    print("Проверьте ini файл на корректное заполнение или убедитесь в наличии файла шаблона и файла с данными!")
+    input("Нажмите Enter для выхода ...")
+    exit(1)
+
+
+# Секции заданий пакетного запуска в ini-файле: [JOB Договоры], [JOB Акты], ...
+JOB_SECTION_PREFIX = 'JOB '
+
+
+class BatchJob:
+    """
+    Задание пакетного запуска: шаблон, файл данных (и лист книги Excel)
+    и шаблон имени результата output, в котором {name} — имя документа
+    из первого столбца, {row} — номер строки. Папка в output постоянная (без {name}
+    и {row}) и создаётся перед запуском.
+    """
+
+    def __init__(self, name, template_name, data_file_name, sheet=None, output=None):
+        self.name = name
+        self.template_name = template_name
+        self.data_file_name = data_file_name
+        self.sheet = sheet or None
+        self.output = output or '{name}' + Path(template_name).suffix
+
+    def output_path(self, output_dir, doc_name, row_idx):
+        return os.path.join(output_dir, self.output.format(name=doc_name, row=row_idx))
+
+    def output_directory(self, output_dir):
+        """Папка результатов задания"""
+        return os.path.join(output_dir, os.path.dirname(self.output))
+
+
+def load_jobs():
+    """
+    Загружает задания из секций [JOB имя] ini-файла с теми же проверками, что load_config().
+    Возвращает пустой список, если заданий нет — тогда действует секция [PATHS].
+    """
+    config = configparser.ConfigParser()
+    config_file_path = os.path.join(os.getcwd(), 'WordGenFromExcel.ini')
+    if not os.path.exists(config_file_path):
+        return []
+    try:
+        config.read(config_file_path, encoding='utf-8')
+        jobs = []
+        for section in config.sections():
+            if not section.startswith(JOB_SECTION_PREFIX):
+                continue
+            name = section[len(JOB_SECTION_PREFIX):].strip()
+            options = config[section]
+            job = BatchJob(
+                name, options.get('template_name'), options.get('data_file_name'),
+                options.get('sheet'), options.get('output')
+            )
+            try:
+                validate_paths(job.template_name, job.data_file_name)
+                if job.sheet and not job.data_file_name.lower().endswith('.xlsx'):
+                    raise ValueError("лист (sheet) указывается только для файлов .xlsx")
+                job.output_path('', 'имя', 1)
+                if '{' in os.path.dirname(job.output):
+                    raise ValueError("папка в output не может зависеть от {name} и {row}")
+            except (KeyError, IndexError) as e:
+                raise ValueError(f"задание {name}: в output допустимы только {{name}} и {{row}}, а не {e}")
+            except ValueError as e:
+                raise ValueError(f"задание {name}: {e}")
+            jobs.append(job)
+
+        outputs = Counter(job.output for job in jobs)
+        repeated = [output for output, count in outputs.items() if count > 1]
+        if repeated:
+            raise ValueError(f"у нескольких заданий одинаковый output: {', '.join(repeated)}")
+        return jobs
 
     except Exception as e:
-        print(f"Ошибка: {e}.")
-        print("Проверьте ini файл на корректное заполнение или убедитесь в наличии файла шаблона и файла с данными!")
-        input("Нажмите Enter для выхода ...")
-        exit(1)
+        config_error(e)
 
 
-def main():
-    # Загрузка конфигурации
-    template_name, data_file_name = load_config()
-    # Конфигурация путей
-    exe_dir = os.getcwd()
+# Сколько строк может ждать обработки в пуле на один процесс.
+# Ограничивает память: строки читаются из Excel не быстрее, чем создаются документы.
+WORKER_BACKLOG = 4
 
-    template_path = os.path.join(exe_dir, template_name)
-    xlsx_path = os.path.join(exe_dir, data_file_name)
 
+# Журнал всех вариантов генерации
+logger = logging.getLogger('WordGenFromExcel')
+# Самый подробный уровень: каждая замена плейсхолдера (-vv или файл --log)
+TRACE = 5
+logging.addLevelName(TRACE, 'TRACE')
+
+# Как часто консоль и файл журнала сбрасывают буфер и обновляется строка прогресса, в секундах
+CONSOLE_INTERVAL = 0.5
+# Если вывод перенаправлен в файл, строка прогресса печатается отдельной строкой не так часто
+REDIRECTED_PROGRESS_INTERVAL = 10.0
+
+
+class ConsoleHandler(logging.Handler):
+    """
+    Вывод журнала в консоль. Сообщения копятся в буфере и выводятся одной записью
+    не чаще раза в CONSOLE_INTERVAL, а не отдельной записью на каждую строку —
+    консоль Windows на тысячах мелких записей тратит минуты. Последней строкой
+    в консоли идёт строка прогресса, которая перерисовывается на месте.
+    Предупреждения и ошибки выводятся в stderr сразу.
+    """
+
+    def __init__(self, stream=None):
+        super().__init__()
+        self.stream = stream or sys.stdout
+        self.interactive = self.stream.isatty()
+        self._pending = []
+        self._progress = ''
+        # Длина строки прогресса, которая сейчас видна в консоли
+        self._shown = 0
+        self._flushed = 0.0
+
+    def emit(self, record):
+        try:
+            message = self.format(record)
+        except Exception:
+            self.handleError(record)
+            return
+        if record.levelno >= logging.WARNING:
+            self._write(force=True)
+            self._clear_progress()
+            sys.stderr.write(message + '\n')
+            sys.stderr.flush()
+            return
+        self._pending.append(message)
+        self._write()
+
+    def set_progress(self, text):
+        """Заменяет строку прогресса"""
+        with self.lock:
+            if self.interactive:
+                self._progress = text
+            else:
+                self._pending.append(text)
+            self._write(force=True)
+
+    def end_progress(self):
+        """Выводит всё накопленное и оставляет строку прогресса в консоли"""
+        with self.lock:
+            self._write(force=True)
+            if self._shown:
+                self.stream.write('\n')
+                self.stream.flush()
+            self._progress = ''
+            self._shown = 0
+
+    def _clear_progress(self):
+        if self._shown:
+            self.stream.write('\r' + ' ' * self._shown + '\r')
+            self.stream.flush()
+            self._shown = 0
+
+    def _write(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._flushed < CONSOLE_INTERVAL:
+            return
+        self._flushed = now
+        if not self._pending and (not self._progress or len(self._progress) == self._shown):
+            return
+        text = ''.join(message + '\n' for message in self._pending)
+        self._pending = []
+        if self._shown:
+            text = '\r' + ' ' * self._shown + '\r' + text
+        text += self._progress
+        self._shown = len(self._progress)
+        self.stream.write(text)
+        self.stream.flush()
+
+    def flush(self):
+        with self.lock:
+            self._write(force=True)
+
+
+class BufferedFileHandler(logging.FileHandler):
+    """Файл журнала (--log), который сбрасывает буфер не после каждой записи, а раз в CONSOLE_INTERVAL"""
+
+    _flushed = 0.0
+
+    def flush(self):
+        now = time.monotonic()
+        if now - self._flushed >= CONSOLE_INTERVAL:
+            self._flushed = now
+            super().flush()
+
+
+def setup_logging(args):
+    """
+    Настраивает журнал по параметрам -q/-v/--log. Возвращает ConsoleHandler
+    для строки прогресса или None, если прогресс не выводится (-q).
+    """
+    logger.handlers.clear()
+    logger.propagate = False
+    console_level = {0: logging.INFO, 1: logging.DEBUG}.get(args.verbose, TRACE)
+    if args.quiet:
+        console_level = logging.WARNING
+    console = ConsoleHandler()
+    console.setLevel(console_level)
+    console.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(console)
+    level = console_level
+    if args.log:
+        # Подробный журнал всегда с каждой заменой, независимо от -q/-v
+        log_file = BufferedFileHandler(args.log, 'w', encoding='utf-8')
+        log_file.setLevel(TRACE)
+        log_file.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(message)s'))
+        logger.addHandler(log_file)
+        level = TRACE
+    logger.setLevel(level)
+    return None if args.quiet else console
+
+
+def format_duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02}:{seconds:02}" if hours else f"{minutes}:{seconds:02}"
+
+
+class Progress:
+    """
+    Строка прогресса: сколько строк готово, документов в секунду и сколько осталось.
+    shards — на сколько машин делится пакет (--shard): эта создаёт примерно 1/shards строк.
+    """
+
+    def __init__(self, console, shards=1):
+        self.console = console
+        self.shards = shards
+        self.total = None
+        self.done = 0
+        self.failed = 0
+        self._start = time.perf_counter()
+        self._shown = 0.0
+        self._interval = CONSOLE_INTERVAL
+        if console is not None and not console.interactive:
+            self._interval = REDIRECTED_PROGRESS_INTERVAL
+
+    def set_sheet_size(self, rows):
+        """Принимает число строк листа из файла Excel (с заголовком) для оценки оставшегося времени"""
+        if rows:
+            self.total = -(-(rows - 1) // self.shards)
+
+    def advance(self, failed=False):
+        self.done += 1
+        self.failed += failed
+        now = time.perf_counter()
+        if self.console is not None and now - self._shown >= self._interval:
+            self._shown = now
+            self.console.set_progress(self.text(now))
+
+    def text(self, now=None):
+        elapsed = (now or time.perf_counter()) - self._start
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        text = f"Готово строк: {self.done}"
+        if self.total and self.total >= self.done:
+            text += f"/{self.total}"
+        if self.failed:
+            text += f", с ошибкой: {self.failed}"
+        text += f", {rate:.1f} док/с"
+        if self.total and rate and self.total > self.done:
+            text += f", осталось ~{format_duration((self.total - self.done) / rate)}"
+        return text
+
+    def finish(self):
+        """Выводит итог: число строк, скорость и общее время"""
+        elapsed = time.perf_counter() - self._start
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        text = f"Готово строк: {self.done}"
+        if self.failed:
+            text += f", с ошибкой: {self.failed}"
+        text += f" за {format_duration(elapsed)} ({rate:.1f} док/с)"
+        if self.console is None:
+            logger.debug(text)
+            return
+        self.console.set_progress(text)
+        self.console.end_progress()
+
+
+def log_replacements(headers, row_data):
+    """Пишет в журнал каждую замену строки — только если включён уровень TRACE"""
+    if logger.isEnabledFor(TRACE):
+        for col_idx in range(1, len(headers)):
+            logger.log(TRACE, "Замена: %s → %s", headers[col_idx], row_data[col_idx])
+
+
+def show_error_box(message):
+    """Показывает окно с ошибкой средствами PowerShell"""
+    import subprocess
+
+    # Текст передается через переменную окружения, а не вставляется в команду:
+    # кавычки, $ и ` в пути шаблона или именах столбцов не ломают скрипт
+    ps_script = (
+        'Add-Type -AssemblyName PresentationFramework;'
+        '[System.Windows.MessageBox]::Show($env:WORDGEN_ERROR_MESSAGE, "Ошибка")'
+    )
+    subprocess.run(
+        ["powershell", "-Command", ps_script],
+        env=dict(os.environ, WORDGEN_ERROR_MESSAGE=message),
+        check=False
+    )
+
+
+def iter_excel_rows(xlsx_path, data_only=False, on_size=None):
+    """
+    Построчно читает активный лист Excel в режиме только для чтения.
+    Строки не накапливаются в памяти, книга закрывается после последней строки.
+    on_size(число_строк) получает размер листа, записанный в файле (для оценки прогресса).
+    """
+    import openpyxl
+
+    wb = openpyxl.load_workbook(xlsx_path, read_only=True, data_only=data_only)
     try:
-        # Работа с Excel-данными
-        wb = openpyxl.load_workbook(xlsx_path)
         sheet = wb.active
-        rows = list(sheet.iter_rows(values_only=True))
+        if on_size is not None:
+            on_size(sheet.max_row)
+        # Размеры листа в файле бывают неверными — читаем все строки как есть
+        sheet.reset_dimensions()
+        yield from sheet.iter_rows(values_only=True)
+    finally:
+        wb.close()
 
-        if not rows:
-            raise ValueError("Файл Excel не содержит данных")
 
-        headers = []
-        for cell in rows[0]:
-            if cell is not None and str(cell).strip() != "":
-                headers.append(str(cell))
-            else:
-                break
-        columns_count = len(headers)
-        if columns_count == 0:
-            raise ValueError("Все ячейки верхней строки Excel файла должны быть заполнены!")
-
-        for row_idx, row in enumerate(rows[1:], 1):
-            # Нормализация данных
-            row_data = []
-            for cell in row[:columns_count]:
-                if cell is None:
-                    row_data.append("-")
-                elif isinstance(cell, datetime):
-                    row_data.append(cell.strftime("%d.%m.%Y"))
-                else:
-                    row_data.append(str(cell).strip() or "-")
+def read_workbook_sheets(xlsx_path, sheet_names, data_only=False):
+    """
+    Читает несколько листов книги Excel за одно открытие файла.
+    Возвращает {имя листа: [строки]}; имя None — активный лист.
+    """
+    import openpyxl
 
-            # Дополнение данных до количества столбцов
-            row_data += ["-"] * (columns_count - len(row_data))
+    wb = openpyxl.load_workbook(xlsx_path, read_only=True, data_only=data_only)
+    try:
+        sheets = {}
+        by_title = {}
+        for name in sheet_names:
+            if name is not None and name not in wb.sheetnames:
+                raise ValueError(f"В книге {os.path.basename(xlsx_path)} нет листа {name}")
+            sheet = wb.active if name is None else wb[name]
+            # Активный лист, указанный и по имени, читается один раз
+            if sheet.title not in by_title:
+                sheet.reset_dimensions()
+                by_title[sheet.title] = list(sheet.iter_rows(values_only=True))
+            sheets[name] = by_title[sheet.title]
+        return sheets
+    finally:
+        wb.close()
 
-            # Извлечение имени документа
-            doc_name = row_data[0].strip() or f"row_{row_idx}"
-            if not doc_name:
-                print(f"Предупреждение: Пустое имя в строке {row_idx}, пропуск")
-                continue
 
-            # Загрузка шаблона
-            doc = Document(template_path)
+def _detect_csv_encoding(csv_path, chunk_size=1024 * 1024):
+    """
+    UTF-8 (с BOM или без), если в ней читается весь файл, иначе cp1251 — так сохраняет CSV русский Excel.
+    Файл проверяется целиком до создания документов: символ cp1251 в конце большого файла
+    иначе остановил бы генерацию на середине.
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    try:
+        with open(csv_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                # Символ, разрезанный границей куска, декодер дочитает со следующим куском
+                decoder.decode(chunk)
+        decoder.decode(b'', final=True)
+    except UnicodeDecodeError:
+        return 'cp1251'
+    return 'utf-8-sig'
 
-            # Выполнение замен
-            for col_idx in range(1, columns_count):
-                placeholder = headers[col_idx]
-                value = row_data[col_idx]
-                replace_text_in_doc(doc, placeholder, value)
-                print(f"Замена: {placeholder} → {value}")
 
-            # Проверка незамененных плейсхолдеров
-            doc_text = get_document_text(doc)
-            missing = [ph for ph in headers[1:] if ph in doc_text]
+def iter_csv_rows(csv_path, data_only=False, on_size=None):
+    """
+    Построчно читает CSV. Разделитель (точка с запятой, запятая или табуляция)
+    определяется по строке заголовков, пустые строки пропускаются.
+    Размер файла в строках заранее не известен, поэтому on_size не вызывается.
+    """
+    with open(csv_path, newline='', encoding=_detect_csv_encoding(csv_path)) as f:
+        delimiter = max(CSV_DELIMITERS, key=f.readline().count)
+        f.seek(0)
+        yield from filter(None, csv.reader(f, delimiter=delimiter))
 
-            if missing:
-                missing_str = ", ".join(missing)
-                print(f"Незамененные значения в шаблоне: {missing_str}.")
-                error_msg = (
-                    "Незамененные значения в шаблоне: "
-                    f"{missing_str}. Убедитесь в едином форматировании!"
-                )
 
-                ps_script = (
-                    'Add-Type -AssemblyName PresentationFramework;'
-                    f'[System.Windows.MessageBox]::Show("{error_msg}", "Ошибка")'
-                )
-                subprocess.run(
-                    ["powershell", "-Command", ps_script],
-                    check=False
+def iter_jsonl_rows(jsonl_path, data_only=False, on_size=None):
+    """
+    Построчно читает JSON Lines: в каждой строке объект {заголовок: значение}.
+    Заголовки и порядок столбцов берутся из первого объекта, ключи,
+    которых в нём нет, не используются.
+    """
+    headers = None
+    with open(jsonl_path, encoding='utf-8-sig') as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                item = json.loads(line)
+            except ValueError as e:
+                raise ValueError(f"Строка {line_number} файла {os.path.basename(jsonl_path)}: {e}") from None
+            if not isinstance(item, dict):
+                raise ValueError(
+                    f"Строка {line_number} файла {os.path.basename(jsonl_path)}: ожидается объект JSON"
                 )
+            if headers is None:
+                headers = tuple(item)
+                yield headers
+            yield tuple(map(item.get, headers))
 
-            # Сохранение результата
-            output_file = f"{doc_name}{Path(template_name).suffix}"
-            output_path = os.path.join(exe_dir, output_file)
-            doc.save(output_path)
-            print(f"Создан документ: {output_path}\n")
 
-        wb.close()
+# Источники строк по расширению файла данных из ini-файла
+ROW_SOURCES = {
+    '.xlsx': iter_excel_rows,
+    '.csv': iter_csv_rows,
+    '.jsonl': iter_jsonl_rows,
+}
 
-    except Exception as e:
-        print(f"КРИТИЧЕСКАЯ ОШИБКА: {str(e)}", file=sys.stderr)
-        input("Нажмите Enter для выхода ...")
-        sys.exit(1)
+
+def iter_data_rows(data_path, data_only=False, on_size=None):
+    """
+    Построчно читает файл данных, выбирая источник по расширению: .xlsx, .csv или .jsonl.
+    Первая строка — заголовки. Все источники читают файл потоком, не целиком.
+    """
+    source = ROW_SOURCES.get(os.path.splitext(data_path)[1].lower())
+    if source is None:
+        raise ValueError(f"Неподдерживаемый файл данных {os.path.basename(data_path)}: нужен {format_suffixes()}")
+    return source(data_path, data_only=data_only, on_size=on_size)
+
+
+def read_headers(first_row):
+    """Возвращает заголовки из первой строки до первой пустой ячейки"""
+    headers = []
+    for cell in first_row:
+        if cell is not None and str(cell).strip() != "":
+            headers.append(str(cell))
+        else:
+            break
+    if not headers:
+        raise ValueError("Все ячейки верхней строки Excel файла должны быть заполнены!")
+    return headers
+
+
+def format_date(value):
+    """Дата для документа: ДД.ММ.ГГГГ"""
+    return '%02d.%02d.%04d' % (value.day, value.month, value.year)
+
+
+def _format_empty(value):
+    return ''
+
+
+def _format_other(value):
+    return str(value).strip()
+
+
+# Преобразование значения ячейки в текст по типу значения (числа и прочее — через str).
+# Один поиск в словаре по типу вместо цепочки isinstance для каждой ячейки.
+CELL_FORMATTERS = {
+    type(None): _format_empty,
+    str: str.strip,
+    int: str,
+    datetime: format_date,
+    date: format_date,
+}
+
+
+def format_cell(value):
+    """Текст значения ячейки: даты — ДД.ММ.ГГГГ, пустая ячейка — пустая строка"""
+    return CELL_FORMATTERS.get(type(value), _format_other)(value)
+
+
+# Дата ISO 8601, как её выгружают в CSV и JSONL: ГГГГ-ММ-ДД, можно со временем
+ISO_DATE = re.compile(r'\s*(\d{4}-\d{2}-\d{2})(?:[T ]\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?)?\s*$')
+
+
+def _parse_iso_date(text):
+    match = ISO_DATE.match(text)
+    if match is None:
+        return None
+    try:
+        return date.fromisoformat(match.group(1))
+    except ValueError:
+        return None
+
+
+def _format_iso_date(text):
+    """Текст столбца дат: дата ISO — ДД.ММ.ГГГГ, остальное как есть"""
+    value = _parse_iso_date(text)
+    return text.strip() if value is None else format_date(value)
+
+
+class ColumnFormatter:
+    """
+    Преобразование значений одного столбца в текст, как format_cell().
+
+    В CSV и JSONL даты приходят текстом, поэтому для текста способ выбирается
+    один раз на столбец, по первому непустому значению: если это дата ISO 8601,
+    все даты столбца выводятся как ДД.ММ.ГГГГ, иначе текст столбца берётся как есть
+    и дальше не разбирается. Значения других типов (числа и null в JSON)
+    оформляются по CELL_FORMATTERS.
+    """
+
+    __slots__ = ('text',)
+
+    def __init__(self):
+        self.text = None
+
+    def __call__(self, value):
+        if type(value) is not str:
+            return CELL_FORMATTERS.get(type(value), _format_other)(value)
+        if self.text is None:
+            if not value.strip():
+                return ''
+            self.text = _format_iso_date if _parse_iso_date(value) is not None else str.strip
+        return self.text(value)
+
+
+# Источники, в которых даты записаны текстом ISO 8601
+TEXT_DATE_SUFFIXES = ('.csv', '.jsonl')
+
+
+def column_formatters(data_path, columns_count):
+    """
+    Преобразования значений в текст по столбцам файла данных: для CSV и JSONL —
+    ColumnFormatter(), для Excel — format_cell(). Текст ячеек Excel выводится
+    как есть, даже если похож на дату.
+    """
+    if os.path.splitext(data_path)[1].lower() in TEXT_DATE_SUFFIXES:
+        return [ColumnFormatter() for _ in range(columns_count)]
+    return [format_cell] * columns_count
+
+
+def iter_row_tasks(rows, columns_count, output_dir, suffix, job=None, formatters=None):
+    """
+    Нормализует строки данных и выдаёт задачи (номер_строки, путь_результата, данные_строки).
+    Имена файлов определяются только данными, поэтому не зависят от числа процессов.
+    Для задания пакета (BatchJob) путь строится по его output, а не по suffix.
+    formatters — преобразования по столбцам из column_formatters(), по умолчанию format_cell().
+    """
+    if formatters is None:
+        formatters = [format_cell] * columns_count
+    for row_idx, row in enumerate(rows, 1):
+        # Нормализация данных: пустые значения заменяются на «-»
+        row_data = [formatter(cell) or "-" for formatter, cell in zip(formatters, row)]
+
+        # Дополнение данных до количества столбцов
+        row_data += ["-"] * (columns_count - len(row_data))
+
+        # Извлечение имени документа
+        doc_name = row_data[0].strip() or f"row_{row_idx}"
+        if not doc_name:
+            logger.warning("Предупреждение: Пустое имя в строке %s, пропуск", row_idx)
+            continue
+
+        if job is not None:
+            yield row_idx, job.output_path(output_dir, doc_name, row_idx), row_data
+        else:
+            yield row_idx, os.path.join(output_dir, f"{doc_name}{suffix}"), row_data
+
+
+def row_values(placeholders, row_data):
+    """Сопоставляет плейсхолдеры значениям строки; при повторе заголовка действует первый столбец"""
+    values = {}
+    for placeholder, value in zip(placeholders, row_data[1:]):
+        values.setdefault(placeholder, value)
+    return values
+
+
+# Этапы в сводке --profile, в порядке выполнения
+PROFILE_STAGES = (
+    'config', 'workbook', 'template', 'read', 'clone', 'substitute', 'validate', 'save', 'write',
+)
+
+
+def peak_rss_mb():
+    """Пиковая память процесса в МБ (None, если узнать нельзя)"""
+    try:
+        import resource
+    except ImportError:
+        try:
+            import psutil
+        except ImportError:
+            return None
+        info = psutil.Process().memory_info()
+        return getattr(info, 'peak_wset', info.rss) / 2 ** 20
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux сообщает килобайты, macOS — байты
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 1024
+
+
+class RowProfile:
+    """Замеры одной строки: этап → (стена, CPU) в секундах, число замен по плейсхолдерам"""
+
+    def __init__(self):
+        self.stages = {}
+        self.counts = Counter()
+        self.pid = os.getpid()
+        self.peak_rss_mb = None
+
+    def add(self, name, wall, cpu):
+        old_wall, old_cpu = self.stages.get(name, (0.0, 0.0))
+        self.stages[name] = (old_wall + wall, old_cpu + cpu)
+
+
+# Замеры текущей строки в этом процессе; None — профилирование выключено
+_row_profile = None
+
+
+@contextmanager
+def profile_stage(name):
+    """Замеряет этап текущей строки, если включено --profile (CPU — только этого потока)"""
+    if _row_profile is None:
+        yield
+        return
+    wall, cpu = time.perf_counter(), time.thread_time()
+    try:
+        yield
+    finally:
+        _row_profile.add(name, time.perf_counter() - wall, time.thread_time() - cpu)
+
+
+def profile_counts(counts):
+    """Добавляет к замерам текущей строки число замен по плейсхолдерам"""
+    if _row_profile is not None:
+        _row_profile.counts.update(counts)
+
+
+def _start_profiling():
+    global _row_profile
+    if _row_profile is None:
+        _row_profile = RowProfile()
+
+
+def profiled_template(template_class, template_path, placeholders):
+    """Разбирает шаблон с замером; время попадает в замеры первой строки процесса"""
+    _start_profiling()
+    with profile_stage('template'):
+        return template_class(template_path, placeholders)
+
+
+def profiled_render(render, template, output_path, row_data):
+    """Выполняет render() с замерами этапов. Возвращает (результат, RowProfile)"""
+    global _row_profile
+    _start_profiling()
+    result = render(template, output_path, row_data)
+    row, _row_profile = _row_profile, RowProfile()
+    row.peak_rss_mb = peak_rss_mb()
+    return result, row
+
+
+def _percentile(values, q):
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class Profiler:
+    """
+    Замеры запуска с --profile: время (стена и CPU) каждого этапа по строкам,
+    число замен по плейсхолдерам и пиковая память. В конце печатается сводка
+    с перцентилями; по --profile-output сохраняется JSON со всеми замерами
+    или, для файла .prof, профиль cProfile этапа создания документов.
+    """
+
+    def __init__(self, enabled=False, output_path=None):
+        self.enabled = enabled
+        self.output_path = output_path
+        self.cprofile = None
+        if enabled and output_path and output_path.lower().endswith('.prof'):
+            self.cprofile = cProfile.Profile()
+        # Замеры по строкам: номер строки → {этап: (стена, CPU)}
+        self.rows = {}
+        # Этапы, выполняемые один раз за запуск (шаблон — один раз на процесс): этап → [(стена, CPU)]
+        self.once = {}
+        self.counts = Counter()
+        # Пиковая память процессов, создававших документы: pid → МБ
+        self.process_rss = {}
+
+    @contextmanager
+    def stage(self, name):
+        """Замеряет этап всего запуска в текущем потоке"""
+        if not self.enabled:
+            yield
+            return
+        wall, cpu = time.perf_counter(), time.thread_time()
+        try:
+            yield
+        finally:
+            self.once.setdefault(name, []).append((time.perf_counter() - wall, time.thread_time() - cpu))
+
+    def time_rows(self, tasks):
+        """Замеряет чтение каждой строки из Excel (выполняется в потоке чтения)"""
+        tasks = iter(tasks)
+        while True:
+            wall, cpu = time.perf_counter(), time.thread_time()
+            task = next(tasks, None)
+            if task is None:
+                return
+            self.rows[task[0]] = {'read': (time.perf_counter() - wall, time.thread_time() - cpu)}
+            yield task
+
+    def cprofiled(self, results):
+        """Включает cProfile в потоке, который создаёт документы"""
+        self.cprofile.enable()
+        try:
+            for result in results:
+                self.cprofile.disable()
+                yield result
+                self.cprofile.enable()
+        finally:
+            self.cprofile.disable()
+
+    def add_row(self, row_idx, row, write):
+        """Добавляет замеры строки, созданной profiled_render(), и время записи"""
+        stages = self.rows.setdefault(row_idx, {})
+        for name, times in row.stages.items():
+            if name == 'template':
+                self.once.setdefault(name, []).append(times)
+                continue
+            stages[name] = times
+        stages['write'] = write
+        self.counts.update(row.counts)
+        if row.peak_rss_mb is not None:
+            self.process_rss[row.pid] = max(self.process_rss.get(row.pid, 0), row.peak_rss_mb)
+
+    def summary(self):
+        """Сводка по этапам: число замеров, сумма, перцентили по стене в миллисекундах"""
+        samples = {name: list(times) for name, times in self.once.items()}
+        for stages in self.rows.values():
+            for name, times in stages.items():
+                samples.setdefault(name, []).append(times)
+        summary = {}
+        for name in sorted(samples, key=PROFILE_STAGES.index):
+            walls = sorted(wall for wall, _ in samples[name])
+            summary[name] = {
+                'count': len(walls),
+                'wall_s': sum(walls),
+                'cpu_s': sum(cpu for _, cpu in samples[name]),
+                'p50_ms': _percentile(walls, 0.5) * 1000,
+                'p90_ms': _percentile(walls, 0.9) * 1000,
+                'p99_ms': _percentile(walls, 0.99) * 1000,
+                'max_ms': walls[-1] * 1000,
+            }
+        return summary
+
+    def report(self):
+        rss = peak_rss_mb()
+        workers_rss = {pid: mb for pid, mb in self.process_rss.items() if pid != os.getpid()}
+        return {
+            'rows': len(self.rows),
+            'peak_rss_mb': rss,
+            'workers_peak_rss_mb': max(workers_rss.values()) if workers_rss else None,
+            'stages': self.summary(),
+            'counts': dict(self.counts),
+            'per_row': [
+                {'row': row_idx, 'stages': stages} for row_idx, stages in sorted(self.rows.items())
+            ],
+        }
+
+    def finish(self):
+        """Печатает сводку и сохраняет замеры в --profile-output"""
+        if not self.enabled:
+            return
+        report = self.report()
+        rss = report['peak_rss_mb']
+        print(f"\nПрофиль: строк {report['rows']}, пиковая память "
+              f"{f'{rss:.0f} МБ' if rss is not None else 'н/д'}"
+              + (f", процессы пула до {report['workers_peak_rss_mb']:.0f} МБ"
+                 if report['workers_peak_rss_mb'] is not None else ""))
+        print(f"{'этап':<11} {'замеров':>8} {'стена, с':>9} {'CPU, с':>8} "
+              f"{'p50, мс':>9} {'p90, мс':>9} {'p99, мс':>9} {'макс, мс':>9}")
+        for name, stage in report['stages'].items():
+            print(f"{name:<11} {stage['count']:>8} {stage['wall_s']:>9.2f} {stage['cpu_s']:>8.2f} "
+                  f"{stage['p50_ms']:>9.1f} {stage['p90_ms']:>9.1f} {stage['p99_ms']:>9.1f} "
+                  f"{stage['max_ms']:>9.1f}")
+        if self.counts:
+            print("Замены по плейсхолдерам: " + ", ".join(
+                f"{ph}: {count}" for ph, count in self.counts.most_common()
+            ))
+        if not self.output_path:
+            return
+        if self.cprofile is not None:
+            self.cprofile.dump_stats(self.output_path)
+        else:
+            with open(self.output_path, 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=1)
+        logger.info("Замеры сохранены в %s", self.output_path)
+
+
+def render_row(template, output_path, row_data):
+    """
+    Создаёт документ по одной строке Excel и сохраняет его в output_path.
+    Возвращает список плейсхолдеров, оставшихся в документе после замены.
+    """
+    # Копия шаблона из памяти
+    with profile_stage('clone'):
+        doc = template.new_document()
+
+    # Выполнение замен только в параграфах с плейсхолдерами
+    with profile_stage('substitute'):
+        counts = template.fill(doc, row_values(template.placeholders, row_data))
+    profile_counts(counts)
+
+    # Сохранение результата
+    with profile_stage('save'):
+        doc.save(output_path)
+
+    # Проверка незамененных плейсхолдеров по индексу шаблона и счётчику замен
+    with profile_stage('validate'):
+        return template.missing(counts)
+
+
+def render_row_raw(template, output_path, row_data):
+    """
+    Быстрый режим: создаёт документ по строке Excel без python-docx.
+    Возвращает плейсхолдеры, которые шаблон не позволяет заменить.
+    """
+    counts = Counter()
+    with profile_stage('substitute'):
+        parts = template.render_parts(row_values(template.placeholders, row_data), counts)
+    profile_counts(counts)
+    with profile_stage('save'):
+        template.write(parts, output_path)
+    return template.unreplaced
+
+
+# Способы замены (--engine): функция создания документа по строке и класс шаблона
+ENGINES = {
+    'docx': (render_row, CompiledTemplate),
+    'raw': (render_row_raw, RawTemplate),
+}
+
+
+def cached_template_class(template_class, args):
+    """Класс шаблона с кэшем на диске из --template-cache, если он не отключён --no-template-cache"""
+    if args.no_template_cache:
+        return template_class
+    return functools.partial(template_class, cache=TemplateDiskCache(args.template_cache))
+
+
+def render_to_memory(render, template, output_path, row_data):
+    """Выполняет render() с записью документа в память. Возвращает (результат, содержимое)"""
+    buffer = io.BytesIO()
+    result = render(template, buffer, row_data)
+    return result, buffer.getvalue()
+
+
+class DirectorySink:
+    """
+    Каждый документ сохраняется отдельным файлом (поведение по умолчанию).
+    Документ создаётся в памяти (в том числе в процессах пула) и записывается
+    на диск в потоке записи, пока создаётся следующий.
+    """
+
+    def renderer(self, render):
+        return functools.partial(render_to_memory, render)
+
+    def add(self, output_path, result):
+        """Сохраняет результат render_to_memory() и возвращает результат проверки"""
+        result, content = result
+        self.write(output_path, content)
+        return result
+
+    def write(self, output_path, content):
+        with open(output_path, 'wb') as f:
+            f.write(content)
+
+    def make_directory(self, path):
+        """Создаёт папку для документов заранее (папки из output заданий пакета)"""
+        os.makedirs(path, exist_ok=True)
+
+    def target(self, output_path):
+        return output_path
+
+    def close(self):
+        pass
+
+
+class ZipSink(DirectorySink):
+    """
+    Все документы в одном zip-архиве (--zip). Каждый документ дописывается
+    в архив сразу после создания, в памяти хранится только текущий.
+    Документы .docx уже сжаты, поэтому в архив они кладутся без повторного сжатия.
+    С root документы лежат в архиве по путям относительно root (каталоги заданий пакета).
+    """
+
+    def __init__(self, path, root=None):
+        self.path = path
+        self.root = root
+        # Архив собирается во временном файле, чтобы сбой не оставил испорченный результат
+        self._tmp_path = path + '.part'
+        self._zip = zipfile.ZipFile(self._tmp_path, 'w', zipfile.ZIP_STORED)
+
+    def write(self, output_path, content):
+        self._zip.writestr(self._name(output_path), content)
+
+    def _name(self, output_path):
+        if self.root is None:
+            return os.path.basename(output_path)
+        return os.path.relpath(output_path, self.root).replace(os.sep, '/')
+
+    def make_directory(self, path):
+        # Папки — часть имён записей в архиве
+        pass
+
+    def target(self, output_path):
+        return f"{self.path}/{self._name(output_path)}"
+
+    def close(self):
+        self._zip.close()
+        os.replace(self._tmp_path, self.path)
+
+
+class MergedDocumentSink(DirectorySink):
+    """
+    Все документы в одном .docx с разрывом страницы между строками (--merge),
+    для массовой печати.
+
+    Документы созданы по одному шаблону, поэтому стили, нумерация и картинки
+    у них общие: из второго и следующих документов переносится только
+    содержимое основной части. Колонтитулы и сноски берутся из первого документа,
+    поэтому плейсхолдеры в них недопустимы (check_merge_template()).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._doc = None
+        self._pages = 0
+
+    def write(self, output_path, content):
+        self._pages += 1
+        if self._doc is None:
+            self._doc = open_docx(io.BytesIO(content))
+            return
+        from docx.oxml import parse_xml
+        from docx.oxml.ns import nsdecls
+
+        with zipfile.ZipFile(io.BytesIO(content)) as z:
+            body = parse_xml(z.read(self._doc.part.partname.membername)).find(W_BODY)
+        target = self._doc.element.body
+        # Свойства раздела в конце тела остаются от первого документа
+        sect_pr = target.sectPr
+        page_break = parse_xml(f'<w:p {nsdecls("w")}><w:r><w:br w:type="page"/></w:r></w:p>')
+        for element in [page_break] + [el for el in body if el.tag != W_SECT_PR]:
+            if sect_pr is not None:
+                sect_pr.addprevious(element)
+            else:
+                target.append(element)
+
+    def make_directory(self, path):
+        # Все документы собираются в один файл
+        pass
+
+    def target(self, output_path):
+        return f"{self.path} (стр. {self._pages})"
+
+    def close(self):
+        if self._doc is None:
+            return
+        tmp_path = self.path + '.part'
+        self._doc.save(tmp_path)
+        os.replace(tmp_path, self.path)
+
+
+def check_merge_template(template_path, placeholders):
+    """
+    Для --merge: ошибка, если плейсхолдеры есть в колонтитулах или сносках шаблона.
+    В объединённый файл эти части попадают только из первого документа,
+    и значения первой строки были бы напечатаны на страницах всех строк.
+    """
+    doc = open_docx(template_path)
+    found = set()
+    for part in story_parts(doc)[1:]:
+        for _, indexes in find_paragraph_slots(part.element, placeholders):
+            found.update(placeholders[idx] for idx in indexes)
+    if found:
+        raise ValueError(
+            "--merge: плейсхолдеры в колонтитулах или сносках шаблона не поддерживаются: "
+            + ', '.join(ph for ph in placeholders if ph in found)
+            + ". Создайте отдельные документы или --zip"
+        )
+
+
+def make_sink(args, root=None, template_path=None, placeholders=()):
+    """
+    Выбирает, куда сохранять документы, по параметрам --zip и --merge.
+    Для --merge шаблон template_path проверяется check_merge_template().
+    """
+    if args.zip:
+        return ZipSink(args.zip, root)
+    if args.merge:
+        if template_path is not None:
+            check_merge_template(template_path, placeholders)
+        return MergedDocumentSink(args.merge)
+    return DirectorySink()
+
+
+# Отчёт о незамененных плейсхолдерах по умолчанию, если в пакете были проблемы
+VALIDATION_REPORT_NAME = 'WordGenFromExcel.validation.json'
+
+
+class ValidationReport:
+    """Сводный отчёт о незамененных плейсхолдерах за весь пакет"""
+
+    def __init__(self, template_name):
+        self.template_name = template_name
+        self.rows_checked = 0
+        # Список (номер_строки, путь_документа, [плейсхолдеры])
+        self.problems = []
+
+    def add(self, row_idx, output_path, missing):
+        self.rows_checked += 1
+        if missing:
+            self.problems.append((row_idx, output_path, list(missing)))
+
+    def missing_placeholders(self):
+        """Незамененные плейсхолдеры с числом документов, в которых они остались"""
+        return Counter(ph for _, _, missing in self.problems for ph in missing)
+
+    def save(self, path):
+        """Сохраняет отчёт в CSV (по расширению .csv) или в JSON"""
+        if path.lower().endswith('.csv'):
+            # utf-8-sig, чтобы Excel сразу открыл файл в правильной кодировке
+            with open(path, 'w', encoding='utf-8-sig', newline='') as f:
+                writer = csv.writer(f, delimiter=';')
+                writer.writerow(["строка", "документ", "плейсхолдер"])
+                for row_idx, output_path, missing in self.problems:
+                    writer.writerows((row_idx, output_path, ph) for ph in missing)
+            return
+        report = {
+            'template': self.template_name,
+            'rows_checked': self.rows_checked,
+            'documents_with_problems': len(self.problems),
+            'missing': dict(self.missing_placeholders()),
+            'rows': [
+                {'row': row_idx, 'document': output_path, 'missing': missing}
+                for row_idx, output_path, missing in self.problems
+            ],
+        }
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=1)
+
+
+def finish_validation(report, report_path, output_dir, show_box=True):
+    """
+    Сохраняет отчёт проверки (всегда, если путь задан явно, иначе только при проблемах)
+    и один раз сообщает о незамененных плейсхолдерах за весь пакет.
+    """
+    if report_path is None and not report.problems:
+        return
+    path = report_path or os.path.join(output_dir, VALIDATION_REPORT_NAME)
+    report.save(path)
+    if not report.problems:
+        return
+    missing_str = ", ".join(report.missing_placeholders())
+    message = (
+        f"Незамененные значения в шаблоне: {missing_str} "
+        f"(документов: {len(report.problems)}). Убедитесь в едином форматировании! "
+        f"Подробности в {path}"
+    )
+    logger.warning(message)
+    # Окно показывается один раз и только при запуске человеком, а не по расписанию
+    if show_box and sys.stdin is not None and sys.stdin.isatty():
+        show_error_box(message)
+
+
+# Состояние процесса пула: шаблон разбирается один раз на процесс
+_worker = {}
+
+
+def _init_worker(render, template_class, template_path, placeholders):
+    _worker['render'] = render
+    try:
+        _worker['template'] = template_class(template_path, placeholders)
+    except Exception as e:
+        # Исключение в инициализаторе заставило бы пул бесконечно перезапускать процессы
+        _worker['error'] = f"Не удалось загрузить шаблон: {e}"
+
+
+def _render_task(render, template, task):
+    """Выполняет одну задачу; ошибка в строке возвращается, а не прерывает весь пакет"""
+    row_idx, output_path, data = task
+    try:
+        return task, render(template, output_path, data), None
+    except Exception as e:
+        return task, None, str(e)
+
+
+def _render_task_in_worker(task):
+    if 'error' in _worker:
+        return task, None, _worker['error']
+    return _render_task(_worker['render'], _worker['template'], task)
+
+
+class DocumentGenerator:
+    """
+    Выполняет render(template, путь_результата, данные) для задач
+    (номер_строки, путь_результата, данные) с шаблоном (template_class), разобранным
+    один раз: в этом процессе или, при workers > 1, в каждом процессе пула.
+    Один объект можно использовать для нескольких пакетов задач подряд (--watch).
+    """
+
+    def __init__(self, render, template_path, placeholders=(), workers=1,
+                 template_class=CompiledTemplate):
+        self._pool = None
+        self._template = None
+        self._render = render
+        self.workers = workers
+        if workers <= 1:
+            self._template = template_class(template_path, placeholders)
+        else:
+            self._pool = multiprocessing.Pool(
+                workers, initializer=_init_worker,
+                initargs=(render, template_class, template_path, placeholders)
+            )
+
+    def run(self, tasks):
+        """Выдаёт тройки (задача, результат, ошибка) строго в порядке задач"""
+        if self._pool is None:
+            for task in tasks:
+                yield _render_task(self._render, self._template, task)
+            return
+        # Pool.imap вычитал бы все задачи сразу, поэтому окно задач ограничивается вручную
+        pending = deque()
+        for task in tasks:
+            pending.append(self._pool.apply_async(_render_task_in_worker, (task,)))
+            if len(pending) >= self.workers * WORKER_BACKLOG:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def generate_documents(tasks, render, template_path, placeholders=(), workers=1,
+                       template_class=CompiledTemplate):
+    """
+    Выполняет render(template, путь_результата, данные) для каждой задачи
+    (номер_строки, путь_результата, данные) и выдаёт тройки (задача, результат, ошибка)
+    строго в порядке задач. При workers > 1 строки распределяются по пулу процессов,
+    каждый из которых разбирает шаблон (template_class) один раз.
+    """
+    with DocumentGenerator(render, template_path, placeholders, workers, template_class) as generator:
+        yield from generator.run(tasks)
+
+
+class RenderError(Exception):
+    """Ошибка при создании документа по одной строке в DocumentRenderer.render()"""
+
+    def __init__(self, row_idx, doc_name, message):
+        super().__init__(f"Строка {row_idx} ({doc_name}): {message}")
+        self.row_idx = row_idx
+        self.doc_name = doc_name
+
+
+class DocumentRenderer:
+    """
+    Создание документов из Python без ini-файла, консоли и записи на диск.
+
+    template — путь к .docx или его содержимое (bytes), headers — заголовки,
+    как в первой строке Excel: первый — имя документа, остальные — плейсхолдеры.
+    Шаблон разбирается один раз (при workers > 1 — в каждом процессе пула),
+    с кэшем cache (TemplateDiskCache) — один раз на все запуски,
+    после чего render() можно вызывать сколько угодно раз:
+
+        with DocumentRenderer(template_bytes, ["Имя файла", "{{Имя}}"]) as renderer:
+            for doc_name, content in renderer.render(rows):
+                storage.put(doc_name + ".docx", content)
+    """
+
+    def __init__(self, template, headers, engine='docx', workers=1, cache=None):
+        if engine not in ENGINES:
+            raise ValueError(f"Неизвестный способ замены {engine}: нужен {', '.join(ENGINES)}")
+        self.headers = read_headers(headers)
+        render, template_class = ENGINES[engine]
+        if cache is not None:
+            template_class = functools.partial(template_class, cache=cache)
+        self._generator = DocumentGenerator(
+            functools.partial(render_to_memory, render), template, self.headers[1:], workers, template_class
+        )
+
+    def render(self, rows):
+        """
+        Выдаёт (имя документа, содержимое .docx) по строкам-словарям {заголовок: значение}
+        в порядке строк. Значения оформляются как ячейки Excel (даты — ДД.ММ.ГГГГ,
+        пустые — «-»), ключи не из headers не используются.
+        Ошибка в строке поднимает RenderError.
+        """
+        rows = (tuple(map(row.get, self.headers)) for row in rows)
+        tasks = iter_row_tasks(rows, len(self.headers), '', '')
+        for (row_idx, doc_name, _), result, error in self._generator.run(tasks):
+            if error is not None:
+                raise RenderError(row_idx, doc_name, error)
+            yield doc_name, result[1]
+
+    def close(self):
+        self._generator.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def render_documents(template, rows, engine='docx', workers=1, cache=None):
+    """
+    Создаёт документы в памяти по строкам-словарям rows и выдаёт пары
+    (имя документа, содержимое .docx). Заголовки берутся из ключей первого
+    словаря, как в файле .jsonl: первый ключ — имя документа.
+    """
+    rows = iter(rows)
+    first = next(rows, None)
+    if first is None:
+        return
+    with DocumentRenderer(template, list(first), engine, workers, cache) as renderer:
+        yield from renderer.render(chain([first], rows))
+
+
+# Длина очередей между стадиями конвейера: столько строк или документов может ждать своей очереди
+PIPELINE_DEPTH = 8
+
+_PIPELINE_END = object()
+
+
+def iter_in_background(iterable, depth=PIPELINE_DEPTH):
+    """
+    Стадия конвейера: элементы iterable вычисляются в фоновом потоке и передаются
+    через очередь не длиннее depth — поток ждёт, пока потребитель не разберёт очередь.
+    Исключение в потоке поднимается у потребителя.
+    """
+    items = queue.Queue(depth)
+    stop = threading.Event()
+
+    def put(entry):
+        # Ожидание с таймаутом, чтобы поток завершился, если потребитель прекратил чтение
+        while not stop.is_set():
+            try:
+                items.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    break
+            else:
+                put((_PIPELINE_END, None))
+        except Exception as e:
+            put((_PIPELINE_END, e))
+        finally:
+            close = getattr(iterable, 'close', None)
+            if close is not None:
+                close()
+
+    threading.Thread(target=produce, daemon=True).start()
+    try:
+        while True:
+            item, error = items.get()
+            if item is _PIPELINE_END:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        stop.set()
+
+
+def _save_results(results, sink, profiler):
+    for task, result, error in results:
+        if error is None:
+            try:
+                wall, cpu = time.perf_counter(), time.thread_time()
+                result = sink.add(task[1], result)
+                if profiler is not None:
+                    result, row = result
+                    write = (time.perf_counter() - wall, time.thread_time() - cpu)
+                    profiler.add_row(task[0], row, write)
+            except Exception as e:
+                result, error = None, f"Не удалось сохранить документ: {e}"
+        yield task, result, error
+
+
+def run_pipeline(tasks, sink, render, template_path, placeholders=(), workers=1,
+                 template_class=CompiledTemplate, profiler=None, generator=None):
+    """
+    Создаёт документы конвейером из трёх стадий в фоновых потоках: чтение строк,
+    создание документов (generate_documents, в том числе с пулом процессов) и запись
+    через sink. Стадии связаны очередями ограниченной длины: запись документа N идёт
+    одновременно с созданием N+1, а в памяти не больше нескольких документов.
+    Выдаёт (задача, результат_проверки, ошибка) строго в порядке задач и только
+    после того, как документ сохранён. С включённым profiler замеряется каждый этап.
+    generator — уже созданный DocumentGenerator (с sink.renderer(render)), если шаблон
+    не нужно разбирать заново.
+    """
+    if profiler is not None and not profiler.enabled:
+        profiler = None
+    if profiler is not None:
+        tasks = profiler.time_rows(tasks)
+        render = functools.partial(profiled_render, render)
+        template_class = functools.partial(profiled_template, template_class)
+    tasks = iter_in_background(tasks)
+    if generator is not None:
+        results = generator.run(tasks)
+    else:
+        results = generate_documents(
+            tasks, sink.renderer(render), template_path, placeholders, workers, template_class
+        )
+    if profiler is not None and profiler.cprofile is not None:
+        results = profiler.cprofiled(results)
+    results = iter_in_background(results)
+    return iter_in_background(_save_results(results, sink, profiler))
+
+
+# Манифест режима --incremental, хранится рядом с созданными документами
+MANIFEST_NAME = 'WordGenFromExcel.manifest.json'
+
+
+def file_sha256(path):
+    """SHA-256 содержимого файла"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def data_sha256(data):
+    """SHA-256 от JSON-представления данных"""
+    text = json.dumps(data, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class IncrementalRun:
+    """
+    Повторный запуск без лишней работы (--incremental).
+
+    В манифесте рядом с документами хранятся хэш шаблона вместе с заголовками,
+    хэш значений каждой строки и хэш созданного файла. Строка пропускается, если
+    ни шаблон, ни её значения не менялись, а файл на месте и не изменён.
+    Строки с одинаковыми значениями создаются один раз, остальные копируются.
+    """
+
+    def __init__(self, output_dir, template_path, headers, generator, row_key):
+        self.path = os.path.join(output_dir, MANIFEST_NAME)
+        self.template_key = data_sha256([file_sha256(template_path), list(headers), generator])
+        # row_key(данные_задачи) — то, от чего зависит содержимое документа
+        self.row_key = row_key
+        self.rows = {}
+        self.skipped = 0
+        self._previous = {}
+        self._known = {}
+        self._first_by_values = {}
+        self._copies = []
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                manifest = json.load(f)
+            self._known = manifest.get('rows', {})
+            if manifest.get('template') == self.template_key:
+                self._previous = self._known
+        except (OSError, ValueError):
+            pass
+
+    def _is_current(self, name, output_path, row_hash):
+        entry = self._previous.get(name)
+        if not entry or entry.get('row') != row_hash:
+            return False
+        try:
+            stat = os.stat(output_path)
+        except OSError:
+            return False
+        # Файл не трогали — содержимое можно не перечитывать
+        if stat.st_size == entry['size'] and stat.st_mtime_ns == entry['mtime_ns']:
+            return True
+        return file_sha256(output_path) == entry['sha256']
+
+    def filter(self, tasks):
+        """Пропускает задачи, документы которых уже актуальны, и откладывает повторы"""
+        for task in tasks:
+            row_idx, output_path, data = task
+            name = os.path.basename(output_path)
+            row_hash = data_sha256(self.row_key(data))
+            if self._is_current(name, output_path, row_hash):
+                self._first_by_values.setdefault(row_hash, output_path)
+                self.rows[name] = self._previous[name]
+                self.skipped += 1
+                logger.debug("Без изменений: %s", output_path)
+                continue
+            self.rows[name] = {'row': row_hash}
+            source = self._first_by_values.setdefault(row_hash, output_path)
+            if source != output_path:
+                self._copies.append((task, source))
+                continue
+            yield task
+
+    def record(self, output_path):
+        """Запоминает созданный документ"""
+        stat = os.stat(output_path)
+        self.rows[os.path.basename(output_path)].update(
+            sha256=file_sha256(output_path), size=stat.st_size, mtime_ns=stat.st_mtime_ns
+        )
+
+    def finish(self, failures):
+        """
+        Копирует отложенные повторы, сообщает об устаревших документах и сохраняет манифест.
+        Строки, которые не удалось создать, добавляются в failures.
+        """
+        failed = {output_path for _, output_path, _ in failures}
+        for (row_idx, output_path, _), source in self._copies:
+            try:
+                if source in failed:
+                    raise ValueError(f"не создан документ с теми же значениями {source}")
+                shutil.copyfile(source, output_path)
+                self.record(output_path)
+                logger.debug("Скопирован документ: %s (совпадает с %s)", output_path, source)
+            except Exception as e:
+                failures.append((row_idx, output_path, str(e)))
+                failed.add(output_path)
+
+        for output_path in failed:
+            self.rows.pop(os.path.basename(output_path), None)
+
+        # Документы из прошлых запусков, для которых больше нет строки в Excel
+        output_dir = os.path.dirname(self.path)
+        stale = sorted(
+            name for name in self._known
+            if name not in self.rows and os.path.exists(os.path.join(output_dir, name))
+        )
+        if stale:
+            logger.warning("Документы без строки в Excel (не удалены): %s", ', '.join(stale))
+        rows = dict(self.rows)
+        rows.update((name, self._known[name]) for name in stale)
+
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'template': self.template_key, 'rows': rows}, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.path)
+        if self.skipped:
+            logger.info("Пропущено без изменений: %s", self.skipped)
+
+
+# Сводка запуска с --shard i/N, хранится рядом с созданными документами
+SHARD_SUMMARY_NAME = 'WordGenFromExcel.shard-{index}-of-{count}.json'
+# Объединённая сводка --merge-shards
+SHARDS_SUMMARY_NAME = 'WordGenFromExcel.shards.json'
+
+
+def parse_shard(value):
+    """Разбирает значение --shard i/N в (i, N); шарды нумеруются с 1"""
+    try:
+        index, count = (int(part) for part in value.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError("ожидается i/N, например 2/4") from None
+    if not 1 <= index <= count:
+        raise argparse.ArgumentTypeError("номер шарда i должен быть от 1 до N")
+    return index, count
+
+
+def shard_of(name, count):
+    """
+    Номер шарда (от 1) для документа с именем name. Берётся из SHA-256 имени,
+    поэтому одинаков на всех машинах и при любом порядке строк; документы
+    с одинаковым именем всегда попадают в один шард.
+    """
+    digest = hashlib.sha256(name.encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') % count + 1
+
+
+class ShardRun:
+    """
+    Часть пакета для одной машины (--shard i/N).
+
+    Каждая машина читает все строки тех же файлов, а создаёт только документы
+    своего шарда (shard_of() от имени файла документа). В сводку рядом
+    с документами записываются хэши входных файлов, размеры всех N шардов
+    и результат каждой своей строки — по ним --merge-shards проверяет,
+    что все строки созданы ровно один раз.
+    """
+
+    def __init__(self, index, count, output_dir, input_paths):
+        self.index = index
+        self.count = count
+        self.output_dir = output_dir
+        self.path = os.path.join(output_dir, SHARD_SUMMARY_NAME.format(index=index, count=count))
+        self.inputs = {os.path.basename(path): file_sha256(path) for path in input_paths}
+        self.sizes = [0] * count
+        # Номер строки → {'document': имя, 'status': ..., 'error': ...}
+        self.rows = {}
+
+    def filter(self, tasks):
+        """Пропускает задачи чужих шардов, считая размер каждого шарда"""
+        for task in tasks:
+            row_idx, output_path, _ = task
+            shard = shard_of(os.path.basename(output_path), self.count)
+            self.sizes[shard - 1] += 1
+            if shard != self.index:
+                continue
+            self.rows[str(row_idx)] = {'document': self._document(output_path), 'status': 'pending', 'error': None}
+            yield task
+
+    def _document(self, output_path):
+        return os.path.relpath(output_path, self.output_dir).replace(os.sep, '/')
+
+    def record(self, row_idx):
+        """Отмечает созданный документ"""
+        self.rows[str(row_idx)]['status'] = 'created'
+
+    def finish(self, failures):
+        """Отмечает ошибки и строки, пропущенные --incremental, и сохраняет сводку шарда"""
+        for row_idx, _, error in failures:
+            self.rows[str(row_idx)].update(status='failed', error=error)
+        for entry in self.rows.values():
+            if entry['status'] == 'pending':
+                # Документ не создавался в этом запуске: актуален с прошлого (--incremental) или скопирован
+                exists = os.path.exists(os.path.join(self.output_dir, entry['document']))
+                entry['status'] = 'unchanged' if exists else 'failed'
+                if not exists:
+                    entry['error'] = "документ не создан"
+        summary = {
+            'shard': self.index,
+            'shards': self.count,
+            'inputs': self.inputs,
+            'sizes': self.sizes,
+            'rows': self.rows,
+        }
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.path)
+        logger.info(
+            "Шард %s/%s: строк %s из %s, сводка сохранена в %s",
+            self.index, self.count, len(self.rows), sum(self.sizes), self.path
+        )
+
+
+# Сколько номеров строк и имён документов показывать в одной проблеме --merge-shards
+SHARD_PROBLEM_ITEMS = 20
+
+
+def _shard_items(items):
+    """Список для сообщения о проблеме: первые SHARD_PROBLEM_ITEMS значений и сколько ещё"""
+    items = sorted(items, key=lambda item: (len(item), item))
+    text = ', '.join(items[:SHARD_PROBLEM_ITEMS])
+    if len(items) > SHARD_PROBLEM_ITEMS:
+        text += f" и ещё {len(items) - SHARD_PROBLEM_ITEMS}"
+    return text
+
+
+def merge_shard_summaries(paths, output_path=None):
+    """
+    Объединяет сводки шардов (--merge-shards) и проверяет, что все шарды одного пакета
+    на месте, каждая строка создана ровно одним шардом и без ошибок, а имена документов
+    не повторяются. Сохраняет объединённую сводку и возвращает True, если проблем нет.
+    """
+    summaries = []
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            summaries.append((path, json.load(f)))
+    if not summaries:
+        raise ValueError("не указаны сводки шардов")
+
+    problems = []
+    first_path, first = summaries[0]
+    for path, summary in summaries[1:]:
+        for field in ('shards', 'inputs', 'sizes'):
+            if summary[field] != first[field]:
+                problems.append(f"{path}: {field} не совпадает с {first_path} — шарды от разных данных или шаблонов")
+    count = first['shards']
+    shards = Counter(summary['shard'] for _, summary in summaries)
+    missing_shards = sorted(set(range(1, count + 1)) - set(shards))
+    if missing_shards:
+        problems.append("нет сводок шардов: " + ', '.join(map(str, missing_shards)))
+    repeated_shards = sorted(shard for shard, n in shards.items() if n > 1)
+    if repeated_shards:
+        problems.append("шарды указаны несколько раз: " + ', '.join(map(str, repeated_shards)))
+
+    produced = Counter()
+    documents = Counter()
+    failed = {}
+    for path, summary in summaries:
+        if summary['shards'] != count or not 1 <= summary['shard'] <= len(first['sizes']):
+            # Сводка другого пакета: её размер не с чем сравнить
+            problems.append(
+                f"{path}: шард {summary['shard']}/{summary['shards']} не входит в пакет из {count} шардов {first_path}"
+            )
+        elif len(summary['rows']) != first['sizes'][summary['shard'] - 1]:
+            problems.append(
+                f"{path}: строк {len(summary['rows'])}, а в шарде {first['sizes'][summary['shard'] - 1]}"
+            )
+        for row, entry in summary['rows'].items():
+            produced[row] += 1
+            documents[entry['document']] += 1
+            if entry['status'] == 'failed':
+                failed[row] = entry['error']
+    repeated_rows = [row for row, n in produced.items() if n > 1]
+    if repeated_rows:
+        problems.append("строки созданы несколько раз: " + _shard_items(repeated_rows))
+    repeated_documents = [name for name, n in documents.items() if n > 1]
+    if repeated_documents:
+        problems.append("одинаковые имена документов: " + _shard_items(repeated_documents))
+    for row, error in sorted(failed.items()):
+        problems.append(f"строка {row} не создана: {error}")
+
+    total = sum(first['sizes'])
+    merged = {
+        'shards': count,
+        'inputs': first['inputs'],
+        'rows_total': total,
+        'rows_done': len(produced.keys() - failed.keys()),
+        'ok': not problems,
+        'problems': problems,
+    }
+    output_path = output_path or os.path.join(os.getcwd(), SHARDS_SUMMARY_NAME)
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(merged, f, ensure_ascii=False, indent=1)
+
+    logger.info(
+        "Шардов: %s из %s, строк: %s, создано: %s. Сводка сохранена в %s",
+        len(shards), count, total, merged['rows_done'], output_path
+    )
+    for problem in problems:
+        logger.error("  %s", problem)
+    if not problems:
+        logger.info("Все строки созданы ровно один раз, имена документов не повторяются")
+    return not problems
+
+
+# Как часто режим --watch проверяет файлы шаблона и данных, в секундах
+WATCH_INTERVAL = 1.0
+
+
+def file_signature(path):
+    """Время изменения и размер файла: меняются, когда файл сохраняют заново"""
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def read_row_tasks(data_path, output_dir, suffix, on_size=None):
+    """Читает заголовки файла данных и возвращает (заголовки, задачи iter_row_tasks() по остальным строкам)"""
+    rows = iter_data_rows(data_path, on_size=on_size)
+    first_row = next(rows, None)
+    if first_row is None:
+        raise ValueError("Файл с данными пуст")
+    headers = read_headers(first_row)
+    formatters = column_formatters(data_path, len(headers))
+    return headers, iter_row_tasks(rows, len(headers), output_dir, suffix, formatters=formatters)
+
+
+class WatchSession:
+    """
+    Режим --watch: программа не завершается, а раз в WATCH_INTERVAL проверяет файлы
+    шаблона и данных из ini-файла.
+
+    Разобранный шаблон (DocumentGenerator) и данные, по которым создан каждый
+    документ, хранятся в памяти между проверками. После сохранения Excel создаются
+    только новые и изменившиеся строки (и документы, удалённые с диска); после
+    сохранения шаблона или изменения заголовков шаблон разбирается заново
+    и создаются все документы.
+
+    read_tasks(путь_excel) возвращает (заголовки, задачи (номер_строки, путь, данные)).
+    """
+
+    def __init__(self, template_path, xlsx_path, read_tasks, render, workers=1,
+                 template_class=CompiledTemplate, report_path=None, console=None):
+        self.template_path = template_path
+        self.xlsx_path = xlsx_path
+        self.read_tasks = read_tasks
+        self.render = render
+        self.workers = workers
+        self.template_class = template_class
+        self.report_path = report_path
+        self.console = console
+        self.sink = DirectorySink()
+        self.generator = None
+        self.headers = None
+        # Путь документа → данные строки, по которым он создан
+        self.snapshot = {}
+        self._signatures = None
+        # Признаки файлов, на которых проход не удался: повтор только после нового сохранения
+        self._failed = None
+
+    def poll(self):
+        """Проверяет файлы и при изменении создаёт нужные документы. Возвращает True, если был проход"""
+        try:
+            signatures = (file_signature(self.template_path), file_signature(self.xlsx_path))
+        except OSError:
+            # Excel и Word сохраняют файл через временный — он может ненадолго пропасть
+            return False
+        if signatures in (self._signatures, self._failed):
+            return False
+        template_changed = self._signatures is None or signatures[0] != self._signatures[0]
+        try:
+            self._run(template_changed)
+        except Exception:
+            self._failed = signatures
+            raise
+        self._signatures = signatures
+        return True
+
+    def _compile(self, headers):
+        if self.generator is not None:
+            self.generator.close()
+            self.generator = None
+        self.generator = DocumentGenerator(
+            self.sink.renderer(self.render), self.template_path, headers[1:], self.workers,
+            self.template_class
+        )
+        self.headers = headers
+        self.snapshot = {}
+
+    def _changed_tasks(self, tasks, seen):
+        for task in tasks:
+            row_idx, output_path, data = task
+            seen.add(output_path)
+            if self.snapshot.get(output_path) == data and os.path.exists(output_path):
+                continue
+            yield task
+
+    def _run(self, template_changed):
+        headers, tasks = self.read_tasks(self.xlsx_path)
+        if template_changed or headers != self.headers:
+            if self.generator is not None:
+                logger.info("Шаблон или заголовки изменились — создаются все документы")
+            self._compile(headers)
+        else:
+            logger.info("Файл данных изменился — создаются новые и изменённые строки")
+
+        seen = set()
+        failures = []
+        report = ValidationReport(os.path.basename(self.template_path))
+        progress = Progress(self.console)
+        results = run_pipeline(self._changed_tasks(tasks, seen), self.sink, None, None, generator=self.generator)
+        for (row_idx, output_path, row_data), missing, error in results:
+            progress.advance(failed=error is not None)
+            if error is not None:
+                logger.error("Ошибка в строке %s: %s", row_idx, error)
+                failures.append((row_idx, output_path, error))
+                continue
+            log_replacements(self.headers, row_data)
+            if missing:
+                logger.debug("Незамененные значения в шаблоне: %s.", ', '.join(missing))
+            report.add(row_idx, output_path, missing)
+            self.snapshot[output_path] = row_data
+            logger.debug("Создан документ: %s", output_path)
+        progress.finish()
+
+        stale = sorted(path for path in self.snapshot if path not in seen)
+        for path in stale:
+            del self.snapshot[path]
+        if stale:
+            logger.warning(
+                "Документы без строки в Excel (не удалены): %s",
+                ', '.join(os.path.basename(path) for path in stale)
+            )
+        if failures:
+            report_failures(failures)
+        finish_validation(report, self.report_path, os.path.dirname(self.xlsx_path), show_box=False)
+
+    def run_forever(self):
+        """Проверяет файлы до нажатия Ctrl+C"""
+        logger.info(
+            "Наблюдение за %s и %s, выход — Ctrl+C",
+            os.path.basename(self.template_path), os.path.basename(self.xlsx_path)
+        )
+        try:
+            while True:
+                try:
+                    self.poll()
+                except Exception as e:
+                    logger.error("Ошибка: %s. Повтор после следующего сохранения файлов", e)
+                time.sleep(WATCH_INTERVAL)
+        except KeyboardInterrupt:
+            logger.info("Наблюдение остановлено")
+        finally:
+            if self.generator is not None:
+                self.generator.close()
+
+
+def read_job_rows(jobs, data_dir):
+    """
+    Строки данных каждого задания пакета. Каждый файл данных открывается и каждый
+    его лист читается один раз, сколько бы заданий его ни использовали; строки
+    хранятся в памяти до конца запуска. Возвращает (строки по заданиям, число листов).
+    """
+    sheets = {}
+    for job in jobs:
+        sheets.setdefault(job.data_file_name, {}).setdefault(job.sheet)
+    for data_file_name, names in sheets.items():
+        data_path = os.path.join(data_dir, data_file_name)
+        if data_file_name.lower().endswith('.xlsx'):
+            names.update(read_workbook_sheets(data_path, list(names)))
+        else:
+            names[None] = list(iter_data_rows(data_path))
+    sheets_read = len({id(rows) for names in sheets.values() for rows in names.values()})
+    return [sheets[job.data_file_name][job.sheet] for job in jobs], sheets_read
+
+
+class TemplateSet:
+    """
+    Шаблоны всех заданий пакета, каждый разобран один раз: задания с одним
+    шаблоном и одинаковыми заголовками используют один объект.
+    specs — список (путь_шаблона, плейсхолдеры) по заданиям. Набор передаётся
+    в DocumentGenerator вместо пути к шаблону и разбирается в каждом процессе
+    пула один раз; placeholders не используется — у каждого задания свои.
+    """
+
+    def __init__(self, specs, placeholders=(), template_class=CompiledTemplate):
+        compiled = {}
+        self.templates = []
+        for template_path, job_placeholders in specs:
+            key = (template_path, tuple(job_placeholders))
+            if key not in compiled:
+                compiled[key] = template_class(template_path, job_placeholders)
+            self.templates.append(compiled[key])
+
+    def __getitem__(self, job_idx):
+        return self.templates[job_idx]
+
+
+def render_job(render, templates, output_path, data):
+    """render() для задачи пакета: templates — TemplateSet, data — (номер задания, данные строки)"""
+    job_idx, row_data = data
+    return render(templates[job_idx], output_path, row_data)
+
+
+def _job_tasks(job, job_idx, tasks):
+    """Задачи задания с номером строки вида «Задание:строка» и номером задания в данных"""
+    for row_idx, output_path, row_data in tasks:
+        yield f"{job.name}:{row_idx}", output_path, (job_idx, row_data)
+
+
+def interleave(iterables):
+    """Выдаёт по одному элементу из каждого iterable по очереди, пока не закончатся все"""
+    iterators = deque(iter(iterable) for iterable in iterables)
+    while iterators:
+        iterator = iterators.popleft()
+        for item in iterator:
+            yield item
+            iterators.append(iterator)
+            break
+
+
+def run_batch(jobs, args, render, template_class, output_dir, progress, profiler):
+    """
+    Выполняет задания [JOB ...] из ini-файла в одном процессе. Файлы данных читаются,
+    а шаблоны разбираются по одному разу; строки всех заданий создаются вперемешку
+    одним конвейером (и одним пулом процессов при --workers), поэтому короткое задание
+    не ждёт длинного. В конце выводится сводка по заданиям.
+    Возвращает список строк, по которым документ не создан.
+    """
+    if args.incremental or args.merge:
+        raise ValueError("задания [JOB ...] нельзя сочетать с --incremental и --merge")
+    start = time.perf_counter()
+    with profiler.stage('workbook'):
+        job_rows, sheets_read = read_job_rows(jobs, output_dir)
+
+    headers = []
+    streams = []
+    for job_idx, (job, rows) in enumerate(zip(jobs, job_rows)):
+        if not rows:
+            raise ValueError(f"задание {job.name}: файл с данными пуст")
+        try:
+            job_headers = read_headers(rows[0])
+        except ValueError as e:
+            raise ValueError(f"задание {job.name}: {e}") from None
+        headers.append(job_headers)
+        formatters = column_formatters(job.data_file_name, len(job_headers))
+        tasks = iter_row_tasks(rows[1:], len(job_headers), output_dir, None, job, formatters)
+        streams.append(_job_tasks(job, job_idx, tasks))
+    specs = [
+        (os.path.join(output_dir, job.template_name), job_headers[1:])
+        for job, job_headers in zip(jobs, headers)
+    ]
+    # Размер «листа» для прогресса: строки всех заданий и одна строка заголовков
+    progress.set_sheet_size(sum(len(rows) - 1 for rows in job_rows) + 1)
+
+    failures = []
+    done = Counter()
+    report = ValidationReport(', '.join(dict.fromkeys(job.template_name for job in jobs)))
+    tasks = interleave(streams)
+    shard = None
+    if args.shard:
+        input_paths = dict.fromkeys(
+            os.path.join(output_dir, name) for job in jobs for name in (job.template_name, job.data_file_name)
+        )
+        shard = ShardRun(*args.shard, output_dir, input_paths)
+        tasks = shard.filter(tasks)
+    sink = make_sink(args, output_dir)
+    for job in jobs:
+        sink.make_directory(job.output_directory(output_dir))
+    results = run_pipeline(
+        tasks, sink, functools.partial(render_job, render), specs, (), args.workers,
+        functools.partial(TemplateSet, template_class=template_class), profiler
+    )
+    for (row_label, output_path, (job_idx, row_data)), missing, error in results:
+        progress.advance(failed=error is not None)
+        if error is not None:
+            logger.error("Ошибка в строке %s: %s", row_label, error)
+            failures.append((row_label, output_path, error))
+            continue
+        log_replacements(headers[job_idx], row_data)
+        if missing:
+            logger.debug("Незамененные значения в шаблоне: %s.", ', '.join(missing))
+        report.add(row_label, output_path, missing)
+        done[job_idx] += 1
+        if shard is not None:
+            shard.record(row_label)
+        logger.debug("Создан документ: %s", sink.target(output_path))
+    sink.close()
+    progress.finish()
+    if shard is not None:
+        shard.finish(failures)
+
+    elapsed = time.perf_counter() - start
+    total = sum(done.values())
+    failed = Counter(label.rsplit(':', 1)[0] for label, _, _ in failures)
+    logger.info(
+        "Заданий: %s, документов %s за %s (%.1f док/с); прочитано файлов данных %s, листов %s, "
+        "разобрано шаблонов %s",
+        len(jobs), total, format_duration(elapsed), total / elapsed if elapsed else 0,
+        len({job.data_file_name for job in jobs}), sheets_read,
+        len({(path, tuple(placeholders)) for path, placeholders in specs})
+    )
+    for job_idx, job in enumerate(jobs):
+        logger.info(
+            "  %s: документов %s (%.0f%%), ошибок %s", job.name, done[job_idx],
+            100 * done[job_idx] / total if total else 0, failed[job.name]
+        )
+    finish_validation(report, args.report, output_dir)
+    return failures
+
+
+def run_merge_shards(paths):
+    """--merge-shards: объединяет сводки шардов; при проблемах завершает программу с кодом 1"""
+    try:
+        ok = merge_shard_summaries(paths)
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        logger.critical("КРИТИЧЕСКАЯ ОШИБКА: не удалось прочитать сводки шардов: %s", e)
+        ok = False
+    if not ok:
+        sys.exit(1)
+
+
+def report_failures(failures):
+    """Выводит итоговый список строк, по которым документ не создан"""
+    logger.error("Не удалось создать документов: %s", len(failures))
+    for row_idx, output_path, error in failures:
+        logger.error("  строка %s (%s): %s", row_idx, output_path, error)
+
+
+def make_arg_parser():
+    """Создаёт разбор общих для всех вариантов параметров командной строки"""
+    parser = argparse.ArgumentParser(
+        description="Создание документов Word по шаблону и данным из Excel"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=1, metavar="N",
+        help="число процессов для генерации документов (по умолчанию 1, 0 — по числу ядер)"
+    )
+    parser.add_argument(
+        "--incremental", action="store_true",
+        help=f"создавать заново только изменившиеся документы (сведения хранятся в {MANIFEST_NAME})"
+    )
+    parser.add_argument(
+        "--report", metavar="PATH",
+        help=f"сохранить отчёт проверки в JSON или CSV (по умолчанию {VALIDATION_REPORT_NAME}, "
+             "только если есть незамененные значения)"
+    )
+    parser.add_argument(
+        "-v", "--verbose", action="count", default=0,
+        help="подробнее: -v — строка на каждый документ, -vv — и на каждую замену"
+    )
+    parser.add_argument(
+        "-q", "--quiet", action="store_true",
+        help="выводить только предупреждения и ошибки, без строки прогресса"
+    )
+    parser.add_argument(
+        "--log", metavar="PATH",
+        help="записать подробный журнал (каждый документ и каждая замена) в файл"
+    )
+    parser.add_argument(
+        "--watch", action="store_true",
+        help="не завершаться: при сохранении Excel создавать новые и изменённые строки, "
+             "при сохранении шаблона — все документы"
+    )
+    parser.add_argument(
+        "--profile", action="store_true",
+        help="замерить время этапов по строкам, число замен и пиковую память, вывести сводку"
+    )
+    parser.add_argument(
+        "--profile-output", metavar="PATH",
+        help="сохранить замеры --profile в JSON или, для файла .prof, профиль cProfile"
+    )
+    parser.add_argument(
+        "--shard", type=parse_shard, metavar="i/N",
+        help="создать только i-ю из N частей документов (для нескольких машин с одинаковыми файлами)"
+    )
+    parser.add_argument(
+        "--merge-shards", nargs="+", metavar="SUMMARY",
+        help=f"объединить сводки шардов ({SHARD_SUMMARY_NAME.format(index='i', count='N')}) "
+             "и проверить, что все строки созданы ровно один раз"
+    )
+    parser.add_argument(
+        "--template-cache", metavar="DIR", default=default_template_cache_dir(),
+        help="каталог, где хранятся разобранные шаблоны между запусками (по умолчанию %(default)s)"
+    )
+    parser.add_argument(
+        "--no-template-cache", action="store_true",
+        help="разбирать шаблон заново при каждом запуске, не читая и не пополняя кэш"
+    )
+    output = parser.add_mutually_exclusive_group()
+    output.add_argument(
+        "--zip", metavar="PATH",
+        help="сложить все документы в один zip-архив вместо отдельных файлов"
+    )
+    output.add_argument(
+        "--merge", metavar="PATH",
+        help="собрать все документы в один .docx с разрывом страницы между строками (для печати)"
+    )
+    return parser
+
+
+def parse_args(argv=None, parser=None):
+    """Разбирает параметры командной строки"""
+    parser = parser or make_arg_parser()
+    args = parser.parse_args(argv)
+    if args.workers < 0:
+        parser.error("--workers не может быть отрицательным")
+    if args.workers == 0:
+        args.workers = os.cpu_count() or 1
+    if args.incremental and (args.zip or args.merge):
+        parser.error("--incremental работает только с отдельными файлами, без --zip и --merge")
+    if args.merge and not args.merge.lower().endswith('.docx'):
+        parser.error("--merge: имя файла должно оканчиваться на .docx")
+    if args.watch and (args.incremental or args.zip or args.merge or args.profile or args.profile_output):
+        parser.error("--watch нельзя сочетать с --incremental, --zip, --merge и --profile")
+    if args.shard and (args.watch or args.merge):
+        parser.error("--shard нельзя сочетать с --watch и --merge")
+    if args.merge_shards and (args.shard or args.watch):
+        parser.error("--merge-shards запускается отдельно, без --shard и --watch")
+    if args.profile_output:
+        args.profile = True
+        if args.profile_output.lower().endswith('.prof') and args.workers > 1:
+            parser.error("--profile-output .prof: cProfile видит только этот процесс, запустите без --workers")
+    return args
+
+
+def _without_doc_name(data):
+    """Ключ строки для --incremental: значения плейсхолдеров без имени документа"""
+    return data[1:]
+
+
+def run_script(args, generator, render, template_class, read_tasks=read_row_tasks,
+               row_key=_without_doc_name, validate=True, batch=False):
+    """
+    Общий main() всех вариантов генерации: ini-файл, --merge-shards, --watch и один
+    проход по файлу данных с --shard, --incremental и отчётом о незамененных значениях;
+    с batch=True — и задания [JOB ...]. Ошибки выводятся в консоль, программа ждёт
+    Enter и завершается с кодом 1.
+
+    generator — имя варианта для манифеста --incremental, render и template_class —
+    как у DocumentGenerator. read_tasks(путь_данных, папка_результатов, расширение, on_size)
+    возвращает (заголовки, задачи), row_key — как у IncrementalRun. validate=False —
+    render не проверяет замены, отчёт о незамененных значениях не ведётся.
+    """
+    console = setup_logging(args)
+    if args.merge_shards:
+        run_merge_shards(args.merge_shards)
+        return
+    progress = Progress(console, args.shard[1] if args.shard else 1)
+    profiler = Profiler(args.profile, args.profile_output)
+    # Загрузка конфигурации: задания [JOB ...] или одна пара файлов из [PATHS]
+    with profiler.stage('config'):
+        jobs = load_jobs() if batch else []
+        if not jobs:
+            template_name, data_file_name = load_config()
+    # Конфигурация путей
+    exe_dir = os.getcwd()
+    template_class = cached_template_class(template_class, args)
+
+    if jobs:
+        try:
+            if args.watch:
+                raise ValueError("задания [JOB ...] нельзя сочетать с --watch")
+            failures = run_batch(jobs, args, render, template_class, exe_dir, progress, profiler)
+            profiler.finish()
+        except Exception as e:
+            logger.critical("КРИТИЧЕСКАЯ ОШИБКА: %s", e)
+            input("Нажмите Enter для выхода ...")
+            sys.exit(1)
+        if failures:
+            report_failures(failures)
+            input("Нажмите Enter для выхода ...")
+            sys.exit(1)
+        return
+
+    template_path = os.path.join(exe_dir, template_name)
+    xlsx_path = os.path.join(exe_dir, data_file_name)
+    suffix = Path(template_name).suffix
+
+    if args.watch:
+        WatchSession(
+            template_path, xlsx_path, lambda path: read_tasks(path, exe_dir, suffix),
+            render, args.workers, template_class, args.report if validate else None, console
+        ).run_forever()
+        return
+
+    failures = []
+    report = ValidationReport(template_name)
+    try:
+        # Работа с данными: строки читаются по одной по мере генерации
+        with profiler.stage('workbook'):
+            headers, tasks = read_tasks(xlsx_path, exe_dir, suffix, on_size=progress.set_sheet_size)
+
+        shard = None
+        if args.shard:
+            shard = ShardRun(*args.shard, exe_dir, [template_path, xlsx_path])
+            tasks = shard.filter(tasks)
+        incremental = None
+        if args.incremental:
+            incremental = IncrementalRun(exe_dir, template_path, headers, generator, row_key)
+            tasks = incremental.filter(tasks)
+
+        sink = make_sink(args, template_path=template_path, placeholders=headers[1:])
+        results = run_pipeline(
+            tasks, sink, render, template_path, headers[1:], args.workers, template_class, profiler
+        )
+
+        for (row_idx, output_path, row_data), missing, error in results:
+            progress.advance(failed=error is not None)
+            if error is not None:
+                logger.error("Ошибка в строке %s: %s", row_idx, error)
+                failures.append((row_idx, output_path, error))
+                continue
+
+            if validate:
+                log_replacements(headers, row_data)
+                if missing:
+                    logger.debug("Незамененные значения в шаблоне: %s.", ', '.join(missing))
+                report.add(row_idx, output_path, missing)
+
+            if incremental is not None:
+                incremental.record(output_path)
+            if shard is not None:
+                shard.record(row_idx)
+            logger.debug("Создан документ: %s", sink.target(output_path))
+
+        sink.close()
+        progress.finish()
+
+        if incremental is not None:
+            incremental.finish(failures)
+        if shard is not None:
+            shard.finish(failures)
+        if validate:
+            finish_validation(report, args.report, exe_dir)
+        profiler.finish()
+
+    except Exception as e:
+        logger.critical("КРИТИЧЕСКАЯ ОШИБКА: %s", e)
+        input("Нажмите Enter для выхода ...")
+        sys.exit(1)
+
+    if failures:
+        report_failures(failures)
+        input("Нажмите Enter для выхода ...")
+        sys.exit(1)
+
+
+def main():
+    parser = make_arg_parser()
+    parser.add_argument(
+        "--engine", choices=tuple(ENGINES), default="docx",
+        help="raw — быстрый режим: замена прямо в XML, остальные части архива копируются без пересжатия"
+    )
+    args = parse_args(parser=parser)
+    render, template_class = ENGINES[args.engine]
+    run_script(args, f"WordGenFromExcel:{args.engine}", render, template_class, batch=True)
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
     main()
\ No newline at end of file
@@ -0,0 +1,452 @@
+"""
+Сравнение скорости вариантов генерации на синтетических шаблонах и данных.
+
+Для каждого сценария создаются шаблон .docx и файл .xlsx заданного размера,
+затем каждый вариант генерации запускается в отдельном процессе.
+Выводятся документы в секунду, время по этапам и пиковая память;
+результаты сохраняются в JSON, чтобы сравнивать их между коммитами:
+
+    python WordGenFromExcel_bench.py --output bench.json
+    python WordGenFromExcel_bench.py --compare bench.json
+
+С --startup замеряется запуск программы: импорт модуля, выход с ошибкой
+в ini-файле и время до первого готового документа с пустым и с заполненным
+кэшем шаблонов (--exe — то же для собранного PyInstaller exe):
+
+    python WordGenFromExcel_bench.py --startup --output startup.json
+"""
+import os
+import sys
+import json
+import time
+import zlib
+import struct
+import random
+import shutil
+import argparse
+import tempfile
+import statistics
+import platform
+import subprocess
+import multiprocessing
+from io import BytesIO
+from datetime import datetime, timedelta
+from collections import Counter
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+
+# Сценарии по умолчанию: параметры шаблона и число строк Excel
+BENCH_SCENARIOS = {
+    'small': dict(pages=2, placeholders=10, split=0.0, nesting=0, images=0, rows=50),
+    'contract': dict(pages=20, placeholders=40, split=0.3, nesting=2, images=2, rows=50),
+    'heavy': dict(pages=40, placeholders=60, split=0.5, nesting=3, images=5, rows=20),
+}
+BENCH_ENGINES = ('docx', 'raw', 'clearFormat', 'pypi')
+# Варианты, запуск которых замеряет --startup
+STARTUP_SCRIPTS = ('WordGenFromExcel.py', 'WordGenFromExcel_clearFormat.py', 'WordGenFromExcel_pypi.py')
+# Библиотеки, которые не должны загружаться до проверки ini-файла
+HEAVY_MODULES = ('docx', 'openpyxl', 'lxml', 'docx_replace_ms')
+# Примерное число абзацев текста на странице A4
+PARAGRAPHS_PER_PAGE = 12
+WORDS = (
+    "настоящий договор стороны обязуются исполнять условия поставки товара в срок "
+    "указанный в спецификации оплата производится на расчётный счёт исполнителя"
+).split()
+
+
+def make_png(width, height, seed):
+    """PNG из случайных пикселей: сжимается плохо, как фотография или скан печати"""
+    rnd = random.Random(seed)
+    row_size = width * 3
+    raw = b''.join(b'\x00' + rnd.randbytes(row_size) for _ in range(height))
+
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+    return (
+        b'\x89PNG\r\n\x1a\n'
+        + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+        + chunk(b'IDAT', zlib.compress(raw))
+        + chunk(b'IEND', b'')
+    )
+
+
+def placeholder_names(count):
+    return [f"{{{{Поле{i}}}}}" for i in range(1, count + 1)]
+
+
+def _add_placeholder(paragraph, placeholder, split, rnd):
+    """Добавляет плейсхолдер одним run'ом или разрезанным на два, как это делает Word"""
+    if rnd.random() < split:
+        middle = len(placeholder) // 2
+        paragraph.add_run(placeholder[:middle])
+        paragraph.add_run(placeholder[middle:])
+    else:
+        paragraph.add_run(placeholder)
+
+
+def _add_nested_table(container, depth, placeholder, split, rnd):
+    table = container.add_table(rows=2, cols=2)
+    for cell in table._cells:
+        cell.paragraphs[0].add_run(' '.join(rnd.choices(WORDS, k=4)) + ' ')
+    inner = table.cell(1, 1)
+    if depth > 1:
+        _add_nested_table(inner, depth - 1, placeholder, split, rnd)
+    else:
+        _add_placeholder(inner.paragraphs[0], placeholder, split, rnd)
+
+
+def make_template(path, pages, placeholders, split, nesting, images, seed=0, **_):
+    """
+    Создаёт синтетический шаблон: pages страниц текста, плейсхолдеры в каждом третьем абзаце,
+    доля split из них разрезана на два run'а, на каждой странице таблица вложенности nesting,
+    images картинок примерно по 1 МБ.
+    """
+    from docx import Document
+    from docx.shared import Inches
+
+    rnd = random.Random(seed)
+    names = placeholder_names(placeholders)
+    doc = Document()
+    for page in range(pages):
+        for i in range(PARAGRAPHS_PER_PAGE):
+            paragraph = doc.add_paragraph(' '.join(rnd.choices(WORDS, k=25)) + ' ')
+            if i % 3 == 0:
+                _add_placeholder(paragraph, names[(page * PARAGRAPHS_PER_PAGE + i) % len(names)], split, rnd)
+                paragraph.add_run(' ' + ' '.join(rnd.choices(WORDS, k=5)))
+        if nesting:
+            _add_nested_table(doc, nesting, names[page % len(names)], split, rnd)
+    for i in range(images):
+        doc.add_picture(BytesIO(make_png(600, 600, seed + i)), width=Inches(4))
+    doc.save(path)
+
+
+def make_data(path, placeholders, rows, seed=0, **_):
+    """Создаёт .xlsx: столбец с именами файлов и по столбцу на плейсхолдер"""
+    import openpyxl
+
+    rnd = random.Random(seed)
+    wb = openpyxl.Workbook(write_only=True)
+    sheet = wb.create_sheet()
+    sheet.append(['Названия файлов'] + placeholder_names(placeholders))
+    start = datetime(2024, 1, 1)
+    for row in range(rows):
+        values = []
+        for col in range(placeholders):
+            kind = col % 3
+            if kind == 0:
+                values.append(' '.join(rnd.choices(WORDS, k=3)))
+            elif kind == 1:
+                values.append(round(rnd.uniform(1, 100000), 2))
+            else:
+                values.append(start + timedelta(days=rnd.randrange(365)))
+        sheet.append([f"doc_{row}"] + values)
+    wb.save(path)
+
+
+@contextmanager
+def timed(stages, name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stages[name] += time.perf_counter() - start
+
+
+def run_engine(engine, template_path, xlsx_path, output_dir):
+    """
+    Создаёт документы одним вариантом генерации и замеряет время этапов.
+    Выполняется в отдельном процессе, чтобы пиковая память не смешивалась между вариантами.
+    """
+    import WordGenFromExcel as core
+
+    stages = Counter()
+    with timed(stages, 'read'):
+        rows = core.iter_excel_rows(xlsx_path)
+        headers = core.read_headers(next(rows))
+        tasks = list(core.iter_row_tasks(rows, len(headers), output_dir, '.docx'))
+    placeholders = headers[1:]
+
+    with timed(stages, 'compile'):
+        if engine == 'raw':
+            template = core.RawTemplate(template_path, placeholders)
+        else:
+            template = core.CompiledTemplate(template_path, placeholders)
+
+    if engine == 'clearFormat':
+        import WordGenFromExcel_clearFormat as variant
+    elif engine == 'pypi':
+        from docx_replace_ms import docx_replace
+
+    missing = 0
+    for _, output_path, row_data in tasks:
+        values = core.row_values(placeholders, row_data)
+        if engine == 'raw':
+            with timed(stages, 'substitute'):
+                parts = template.render_parts(values)
+            with timed(stages, 'save'):
+                template.write(parts, output_path)
+            missing += len(template.unreplaced)
+            continue
+
+        with timed(stages, 'clone'):
+            doc = template.new_document()
+        counts = Counter()
+        with timed(stages, 'substitute'):
+            if engine == 'docx':
+                counts = template.fill(doc, values)
+            elif engine == 'clearFormat':
+                for paragraph, _ in template.paragraphs(doc):
+                    variant.replace_placeholders_in_paragraph(paragraph, template.pattern, values, counts)
+            else:
+                docx_replace(doc, **values)
+        with timed(stages, 'validate'):
+            if engine == 'pypi':
+                # docx_replace не сообщает о заменах — только полный текст документа
+                text = core.get_document_text(doc)
+                missing += sum(ph in text for ph in placeholders)
+            else:
+                missing += len(template.missing(counts))
+        with timed(stages, 'save'):
+            doc.save(output_path)
+
+    render_time = sum(seconds for stage, seconds in stages.items() if stage != 'read')
+    return {
+        'docs': len(tasks),
+        'docs_per_sec': len(tasks) / render_time if render_time else None,
+        'stages': dict(stages),
+        'missing': missing,
+        'output_mb': sum(os.path.getsize(path) for _, path, _ in tasks) / 2 ** 20,
+        'peak_rss_mb': core.peak_rss_mb(),
+    }
+
+
+def run_timed(command, cwd):
+    """Время выполнения команды в мс и код возврата. Ввод закрыт: input() после ошибки не ждёт"""
+    start = time.perf_counter()
+    result = subprocess.run(
+        command, cwd=cwd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    return (time.perf_counter() - start) * 1000, result.returncode
+
+
+def write_ini(path, template_name, data_file_name):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(f"[PATHS]\ntemplate_name = {template_name}\ndata_file_name = {data_file_name}\n")
+
+
+def measure_startup(name, command, module, work_dir, repeat):
+    """
+    Замеряет запуск варианта: медианы по repeat запускам, в мс.
+    import — импорт модуля без python (только для .py), config_error — выход
+    с ошибкой в ini-файле, first_document — создание одного документа с пустым
+    кэшем шаблонов (первый запуск), first_document_cached — с кэшем, заполненным
+    предыдущим запуском. Кэш каждого запуска лежит в work_dir, а не в кэше пользователя.
+    """
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    timings = {}
+    heavy = []
+    if module is not None:
+        code = f"import sys; import {module}; print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+        loaded = subprocess.run(
+            [sys.executable, '-c', code], cwd=script_dir, capture_output=True, text=True, check=True
+        )
+        heavy = [m for m in loaded.stdout.strip().split(',') if m]
+        empty = [run_timed([sys.executable, '-c', 'pass'], script_dir)[0] for _ in range(repeat)]
+        imports = [run_timed([sys.executable, '-c', f'import {module}'], script_dir)[0] for _ in range(repeat)]
+        timings['import'] = statistics.median(imports) - statistics.median(empty)
+
+    error_dir = os.path.join(work_dir, name, 'config_error')
+    os.makedirs(error_dir)
+    write_ini(os.path.join(error_dir, 'WordGenFromExcel.ini'), 'нет_такого.docx', 'data.xlsx')
+    error_command = command + ['--template-cache', os.path.join(error_dir, 'cache')]
+    timings['config_error'] = statistics.median(run_timed(error_command, error_dir)[0] for _ in range(repeat))
+
+    def first_document(run_name, cache_dir):
+        run_dir = os.path.join(work_dir, name, run_name)
+        os.makedirs(run_dir)
+        for file_name in ('template.docx', 'data.xlsx'):
+            shutil.copy(os.path.join(work_dir, file_name), run_dir)
+        write_ini(os.path.join(run_dir, 'WordGenFromExcel.ini'), 'template.docx', 'data.xlsx')
+        elapsed, returncode = run_timed(command + ['--template-cache', cache_dir], run_dir)
+        if returncode != 0 or not os.path.exists(os.path.join(run_dir, 'doc_0.docx')):
+            raise RuntimeError(f"{name}: документ не создан (код выхода {returncode})")
+        return elapsed
+
+    # Пустой кэш у каждого запуска: шаблон разбирается заново, как при первом запуске
+    timings['first_document'] = statistics.median(
+        first_document(f'run_{i}', os.path.join(work_dir, name, f'cache_{i}')) for i in range(repeat)
+    )
+    # Общий кэш, заполненный запуском без замера: шаблон берётся с диска
+    cache_dir = os.path.join(work_dir, name, 'cache')
+    first_document('warm_up', cache_dir)
+    timings['first_document_cached'] = statistics.median(
+        first_document(f'cached_run_{i}', cache_dir) for i in range(repeat)
+    )
+    return {'startup_ms': timings, 'heavy_imports': heavy}
+
+
+def run_startup(args, work_dir):
+    """Замеры --startup для каждого варианта или для собранного exe"""
+    make_template(os.path.join(work_dir, 'template.docx'), **BENCH_SCENARIOS['small'])
+    make_data(os.path.join(work_dir, 'data.xlsx'), **dict(BENCH_SCENARIOS['small'], rows=1))
+    if args.exe:
+        targets = [(os.path.basename(args.exe), [os.path.abspath(args.exe)], None)]
+    else:
+        script_dir = os.path.dirname(os.path.abspath(__file__))
+        targets = [
+            (script, [sys.executable, os.path.join(script_dir, script)], script[:-3])
+            for script in STARTUP_SCRIPTS
+            if script != 'WordGenFromExcel_pypi.py' or engine_available('pypi')
+        ]
+    results = []
+    for name, command, module in targets:
+        result = measure_startup(name, command, module, work_dir, args.repeat)
+        result.update(scenario='startup', engine=name)
+        results.append(result)
+        print(format_result(result))
+    return results
+
+
+def engine_available(engine):
+    if engine != 'pypi':
+        return True
+    try:
+        import docx_replace_ms  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def git_revision():
+    try:
+        result = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), check=True
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return result.stdout.strip()
+
+
+def format_result(result):
+    if 'startup_ms' in result:
+        timings = '  '.join(f"{name} {ms:6.0f} мс" for name, ms in result['startup_ms'].items())
+        heavy = ', '.join(result['heavy_imports']) or 'нет'
+        return f"{result['engine']:<32} {timings}  тяжёлые импорты при запуске: {heavy}"
+    stages = ' '.join(f"{name}={seconds:.2f}с" for name, seconds in result['stages'].items())
+    rss = f"{result['peak_rss_mb']:.0f} МБ" if result['peak_rss_mb'] is not None else "н/д"
+    return (
+        f"{result['scenario']:<10} {result['engine']:<12} {result['docs_per_sec']:8.1f} док/с"
+        f"  память {rss:>7}  {stages}"
+    )
+
+
+def compare(results, previous_path):
+    """Печатает изменение скорости относительно сохранённого ранее запуска"""
+    with open(previous_path, encoding='utf-8') as f:
+        previous = json.load(f)
+    before = {(r['scenario'], r['engine']): r for r in previous['results']}
+    print(f"\nСравнение с {previous_path} (ревизия {previous.get('revision')}):")
+    for result in results:
+        old = before.get((result['scenario'], result['engine']))
+        if old and 'startup_ms' in result:
+            print(f"{result['engine']:<32} " + '  '.join(
+                f"{name} {old['startup_ms'][name]:.0f} → {ms:.0f} мс"
+                for name, ms in result['startup_ms'].items() if name in old.get('startup_ms', {})
+            ))
+            continue
+        if not old or not old.get('docs_per_sec'):
+            continue
+        change = (result['docs_per_sec'] / old['docs_per_sec'] - 1) * 100
+        print(
+            f"{result['scenario']:<10} {result['engine']:<12} "
+            f"{old['docs_per_sec']:8.1f} → {result['docs_per_sec']:8.1f} док/с ({change:+.0f}%)"
+        )
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scenarios", nargs="+", default=list(BENCH_SCENARIOS),
+                        choices=list(BENCH_SCENARIOS), help="сценарии для запуска")
+    parser.add_argument("--engines", nargs="+", default=list(BENCH_ENGINES),
+                        choices=BENCH_ENGINES, help="сравниваемые варианты генерации")
+    for name in ('pages', 'placeholders', 'nesting', 'images', 'rows'):
+        parser.add_argument(f"--{name}", type=int, help=f"заменить {name} во всех сценариях")
+    parser.add_argument("--split", type=float, help="заменить долю разрезанных плейсхолдеров")
+    parser.add_argument("--output", help="сохранить результаты в JSON")
+    parser.add_argument("--compare", metavar="JSON", help="сравнить с результатами прошлого запуска")
+    parser.add_argument("--keep", action="store_true", help="не удалять сгенерированные файлы")
+    parser.add_argument("--startup", action="store_true",
+                        help="замерить запуск: импорт, выход с ошибкой ini, время до первого документа")
+    parser.add_argument("--exe", metavar="PATH", help="с --startup: замерить собранный exe вместо скриптов")
+    parser.add_argument("--repeat", type=int, default=5, help="с --startup: число запусков (по умолчанию 5)")
+    args = parser.parse_args(argv)
+    if args.exe and not args.startup:
+        parser.error("--exe используется только с --startup")
+    return args
+
+
+def run_scenarios(args, work_dir):
+    """Замеры скорости вариантов генерации по сценариям"""
+    overrides = {
+        name: getattr(args, name)
+        for name in ('pages', 'placeholders', 'split', 'nesting', 'images', 'rows')
+        if getattr(args, name) is not None
+    }
+    context = multiprocessing.get_context('spawn')
+    results = []
+    for scenario in args.scenarios:
+        params = dict(BENCH_SCENARIOS[scenario], **overrides)
+        scenario_dir = os.path.join(work_dir, scenario)
+        os.makedirs(scenario_dir)
+        template_path = os.path.join(scenario_dir, 'template.docx')
+        xlsx_path = os.path.join(scenario_dir, 'data.xlsx')
+        make_template(template_path, **params)
+        make_data(xlsx_path, **params)
+
+        for engine in args.engines:
+            if not engine_available(engine):
+                print(f"{scenario:<10} {engine:<12} пропущен: не установлен docx_replace_ms")
+                continue
+            output_dir = os.path.join(scenario_dir, engine)
+            os.makedirs(output_dir)
+            # Новый процесс на каждый замер — пиковая память не переходит между вариантами
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                result = executor.submit(
+                    run_engine, engine, template_path, xlsx_path, output_dir
+                ).result()
+            result.update(scenario=scenario, engine=engine, params=params)
+            results.append(result)
+            print(format_result(result))
+    return results
+
+
+def main():
+    args = parse_args()
+    work_dir = tempfile.mkdtemp(prefix='wordgen_bench_')
+    try:
+        results = run_startup(args, work_dir) if args.startup else run_scenarios(args, work_dir)
+    finally:
+        if args.keep:
+            print(f"Файлы сохранены в {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=1)
+        print(f"Результаты сохранены в {args.output}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Нагрузочная проверка сервиса WordGenFromExcel_server.py на этом компьютере.
+
+Запросы строятся по строкам файла данных из WordGenFromExcel.ini (или --data)
+и отправляются в --concurrency потоков. Выводятся скорость, время ответа
+с перцентилями, число ошибок и метрики сервиса (попадания в кэш шаблонов):
+
+    python WordGenFromExcel_server.py
+    python WordGenFromExcel_loadtest.py --requests 500 --concurrency 8
+"""
+import os
+import json
+import time
+import argparse
+import configparser
+import urllib.request
+import urllib.error
+from itertools import cycle, islice
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from WordGenFromExcel import read_row_tasks, row_values
+
+
+def read_ini():
+    """Имена шаблона и файла данных из WordGenFromExcel.ini в текущем каталоге"""
+    config = configparser.ConfigParser()
+    config.read(os.path.join(os.getcwd(), 'WordGenFromExcel.ini'), encoding='utf-8')
+    return config.get('PATHS', 'template_name'), config.get('PATHS', 'data_file_name')
+
+
+def load_requests(template_id, xlsx_path, engine=None):
+    """Тела запросов к /render: по одному на строку файла данных"""
+    headers, tasks = read_row_tasks(xlsx_path, os.getcwd(), '.docx')
+    bodies = []
+    for _, _, row_data in tasks:
+        request = {'template': template_id, 'values': row_values(headers[1:], row_data)}
+        if engine:
+            request['engine'] = engine
+        bodies.append(json.dumps(request, ensure_ascii=False).encode('utf-8'))
+    if not bodies:
+        raise ValueError("В файле данных нет строк с данными")
+    return bodies
+
+
+def send(url, body, timeout):
+    """Отправляет один запрос. Возвращает (код ответа, время в секундах, размер ответа)"""
+    request = urllib.request.Request(url, data=body, headers={'Content-Type': 'application/json'})
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            size = len(response.read())
+            status = response.status
+    except urllib.error.HTTPError as e:
+        size = len(e.read())
+        status = e.code
+    except OSError:
+        status, size = 'нет ответа', 0
+    return status, time.perf_counter() - start, size
+
+
+def percentile(values, q):
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--url", default="http://127.0.0.1:8765", help="адрес сервиса")
+    parser.add_argument("--template", help="имя шаблона (по умолчанию из ini)")
+    parser.add_argument("--data", help="файл данных .xlsx, .csv или .jsonl (по умолчанию из ini)")
+    parser.add_argument("--engine", choices=("docx", "raw"), help="способ замены в запросах")
+    parser.add_argument("--requests", type=int, default=200, help="число запросов (по умолчанию 200)")
+    parser.add_argument("--concurrency", type=int, default=8, help="одновременных запросов (по умолчанию 8)")
+    parser.add_argument("--timeout", type=float, default=60.0, help="таймаут запроса, с")
+    parser.add_argument("--output", help="сохранить результаты в JSON")
+    return parser.parse_args(argv)
+
+
+def main():
+    args = parse_args()
+    template_name = args.template
+    data_file_name = args.data
+    if template_name is None or data_file_name is None:
+        ini_template, ini_data = read_ini()
+        template_name = template_name or ini_template
+        data_file_name = data_file_name or ini_data
+    bodies = load_requests(template_name, data_file_name, args.engine)
+    render_url = args.url.rstrip('/') + '/render'
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as executor:
+        results = list(executor.map(
+            lambda body: send(render_url, body, args.timeout), islice(cycle(bodies), args.requests)
+        ))
+    elapsed = time.perf_counter() - start
+
+    statuses = Counter(status for status, _, _ in results)
+    latencies = sorted(seconds for status, seconds, _ in results if status == 200)
+    report = {
+        'requests': len(results),
+        'concurrency': args.concurrency,
+        'elapsed_s': elapsed,
+        'docs_per_sec': len(latencies) / elapsed if elapsed else None,
+        'statuses': {str(status): count for status, count in statuses.items()},
+        'mb_received': sum(size for _, _, size in results) / 2 ** 20,
+    }
+    if latencies:
+        report['latency_ms'] = {
+            name: percentile(latencies, q) * 1000
+            for name, q in (('p50', 0.5), ('p90', 0.9), ('p99', 0.99), ('max', 1.0))
+        }
+    try:
+        with urllib.request.urlopen(args.url.rstrip('/') + '/metrics', timeout=args.timeout) as response:
+            report['service'] = json.load(response)
+    except OSError:
+        report['service'] = None
+
+    print(f"Запросов: {report['requests']} в {args.concurrency} потоков за {elapsed:.1f} с, "
+          f"{report['docs_per_sec']:.1f} док/с")
+    print("Ответы: " + ", ".join(f"{status}: {count}" for status, count in statuses.most_common()))
+    if latencies:
+        print("Время ответа, мс: " + ", ".join(
+            f"{name} {value:.1f}" for name, value in report['latency_ms'].items()
+        ))
+    if report['service']:
+        cache = report['service']['cache']
+        print(f"Кэш шаблонов: попаданий {cache['hits']}, промахов {cache['misses']}, "
+              f"вытеснено {cache['evictions']}; одновременно запросов до "
+              f"{report['service']['peak_in_flight']}")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=1)
+        print(f"Результаты сохранены в {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,301 @@
+"""
+Локальный HTTP-сервис для создания одного документа по запросу.
+
+Клиент отправляет POST /render с JSON:
+
+    {"template": "Договор.docx", "values": {"{{Имя}}": "Иван", "{{Сумма}}": "100"}}
+
+и получает в ответ файл .docx. Шаблоны берутся из каталога --templates
+(по умолчанию текущего) и после первого запроса хранятся разобранными
+в кэше LRU. GET /metrics возвращает число запросов, одновременных запросов,
+попаданий и промахов кэша и время ответа.
+
+    python WordGenFromExcel_server.py --port 8765
+"""
+import os
+import json
+import argparse
+import time
+import threading
+from io import BytesIO
+from collections import Counter, OrderedDict, deque
+from urllib.parse import quote
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from WordGenFromExcel import ENGINES, RawTemplate, setup_logging, logger
+
+DOCX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+# Сколько последних запросов учитывается во времени ответа в /metrics
+LATENCY_WINDOW = 1000
+# Ограничение размера тела запроса, байт
+MAX_REQUEST_BYTES = 10 * 2 ** 20
+
+
+class TemplateCache:
+    """
+    Кэш LRU разобранных шаблонов, не больше max_entries записей.
+
+    Ключ — путь к файлу, время изменения и размер файла и набор плейсхолдеров:
+    сохранённый заново шаблон разбирается заново, а его старая версия
+    удаляется из кэша. Один и тот же шаблон разбирается только одним потоком,
+    остальные запросы к нему ждут результата.
+    """
+
+    def __init__(self, max_entries=32):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Ключ → (шаблон, блокировка для шаблонов, которые нельзя заполнять одновременно)
+        self._entries = OrderedDict()
+        self._compiling = {}
+        self._lock = threading.Lock()
+
+    def get(self, path, placeholders, template_class):
+        stat = os.stat(path)
+        key = (path, stat.st_mtime_ns, stat.st_size, placeholders, template_class.__name__)
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is not None:
+                return entry
+            key_lock = self._compiling.setdefault(key, threading.Lock())
+
+        with key_lock:
+            with self._lock:
+                # Пока ждали, шаблон мог разобрать другой запрос
+                entry = self._lookup(key)
+                if entry is not None:
+                    return entry
+                self.misses += 1
+            try:
+                entry = (template_class(path, placeholders), threading.Lock())
+            finally:
+                with self._lock:
+                    self._compiling.pop(key, None)
+            with self._lock:
+                # Старые версии того же файла больше не понадобятся
+                for old_key in [k for k in self._entries if k[0] == path and k[1:3] != key[1:3]]:
+                    del self._entries[old_key]
+                    self.evictions += 1
+                self._entries[key] = entry
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        return entry
+
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return entry
+
+    def metrics(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else None,
+                'evictions': self.evictions,
+            }
+
+
+class ServiceMetrics:
+    """Счётчики запросов: всего, по кодам ответа, одновременно выполняемые, время ответа"""
+
+    def __init__(self):
+        self.requests = 0
+        self.statuses = Counter()
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.started = time.time()
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._lock = threading.Lock()
+
+    def begin(self):
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def end(self, status, seconds):
+        with self._lock:
+            self.in_flight -= 1
+            self.statuses[status] += 1
+            self._latencies.append(seconds)
+
+    def snapshot(self):
+        with self._lock:
+            latencies = sorted(self._latencies)
+            result = {
+                'uptime_s': time.time() - self.started,
+                'requests': self.requests,
+                'statuses': {str(status): count for status, count in self.statuses.items()},
+                'in_flight': self.in_flight,
+                'peak_in_flight': self.peak_in_flight,
+            }
+        if latencies:
+            result['latency_ms'] = {
+                name: latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000
+                for name, q in (('p50', 0.5), ('p90', 0.9), ('p99', 0.99), ('max', 1.0))
+            }
+        return result
+
+
+class RequestError(Exception):
+    """Ошибка в запросе клиента: возвращается с указанным кодом ответа"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def render_document(template, lock, values):
+    """
+    Создаёт документ по шаблону из кэша.
+    Возвращает (содержимое .docx, незамененные плейсхолдеры).
+    """
+    buffer = BytesIO()
+    if isinstance(template, RawTemplate):
+        # Быстрый режим не меняет разобранный шаблон, запросы выполняются параллельно
+        template.save(values, buffer)
+        return buffer.getvalue(), template.unreplaced
+    # CompiledTemplate заполняет одну общую копию документа — по одному запросу за раз
+    with lock:
+        doc = template.new_document()
+        counts = template.fill(doc, values)
+        doc.save(buffer)
+        return buffer.getvalue(), template.missing(counts)
+
+
+class RenderHandler(BaseHTTPRequestHandler):
+    server_version = 'WordGenFromExcel'
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        if self.path.rstrip('/') != '/metrics':
+            self._send_json(404, {'error': "неизвестный адрес"})
+            return
+        metrics = self.server.metrics.snapshot()
+        metrics['cache'] = self.server.cache.metrics()
+        self._send_json(200, metrics)
+
+    def do_POST(self):
+        start = time.perf_counter()
+        self.server.metrics.begin()
+        status = 500
+        try:
+            if self.path.rstrip('/') != '/render':
+                raise RequestError(404, "неизвестный адрес")
+            template_id, values, template_class = self._read_request()
+            path = self.server.template_path(template_id)
+            placeholders = tuple(sorted(values))
+            template, lock = self.server.cache.get(path, placeholders, template_class)
+            content, missing = render_document(template, lock, values)
+            status = 200
+            self.send_response(200)
+            self.send_header('Content-Type', DOCX_CONTENT_TYPE)
+            self.send_header('Content-Length', str(len(content)))
+            if missing:
+                self.send_header('X-Unreplaced-Placeholders', quote(','.join(missing)))
+            self.end_headers()
+            self.wfile.write(content)
+        except RequestError as e:
+            status = e.status
+            self._send_json(status, {'error': str(e)})
+        except Exception as e:
+            logger.exception("Ошибка при создании документа")
+            self._send_json(500, {'error': str(e)})
+        finally:
+            self.server.metrics.end(status, time.perf_counter() - start)
+
+    def _read_request(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length > MAX_REQUEST_BYTES:
+            raise RequestError(413, "слишком большой запрос")
+        try:
+            request = json.loads(self.rfile.read(length).decode('utf-8'))
+        except (UnicodeDecodeError, ValueError) as e:
+            raise RequestError(400, f"тело запроса должно быть JSON: {e}")
+        if not isinstance(request, dict) or not isinstance(request.get('template'), str):
+            raise RequestError(400, "нужно поле template с именем файла шаблона")
+        values = request.get('values')
+        if not isinstance(values, dict):
+            raise RequestError(400, "нужно поле values: {плейсхолдер: значение}")
+        engine = request.get('engine', self.server.engine)
+        if engine not in ENGINES:
+            raise RequestError(400, "engine: " + " или ".join(ENGINES))
+        template_class = ENGINES[engine][1]
+        values = {str(key): '' if value is None else str(value) for key, value in values.items()}
+        return request['template'], values, template_class
+
+    def _send_json(self, status, data):
+        body = json.dumps(data, ensure_ascii=False, indent=1).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug("%s %s", self.address_string(), format % args)
+
+
+class RenderServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, templates_dir, cache_size=32, engine='raw'):
+        super().__init__(address, RenderHandler)
+        self.templates_dir = os.path.realpath(templates_dir)
+        self.engine = engine
+        self.cache = TemplateCache(cache_size)
+        self.metrics = ServiceMetrics()
+
+    def template_path(self, template_id):
+        """Путь к шаблону по его имени; за пределы каталога шаблонов выйти нельзя"""
+        path = os.path.realpath(os.path.join(self.templates_dir, template_id))
+        if os.path.commonpath([path, self.templates_dir]) != self.templates_dir:
+            raise RequestError(400, "шаблон должен лежать в каталоге шаблонов")
+        if not path.lower().endswith('.docx') or not os.path.isfile(path):
+            raise RequestError(404, f"не найден шаблон {template_id}")
+        return path
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1", help="адрес (по умолчанию только этот компьютер)")
+    parser.add_argument("--port", type=int, default=8765, help="порт (по умолчанию 8765)")
+    parser.add_argument("--templates", default=os.getcwd(), metavar="DIR", help="каталог с шаблонами")
+    parser.add_argument("--cache-size", type=int, default=32, metavar="N",
+                        help="сколько разобранных шаблонов хранить в памяти (по умолчанию 32)")
+    parser.add_argument("--engine", choices=tuple(ENGINES), default="raw",
+                        help="способ замены по умолчанию (в запросе можно указать поле engine)")
+    parser.add_argument("-v", "--verbose", action="count", default=0, help="выводить каждый запрос")
+    parser.add_argument("-q", "--quiet", action="store_true", help="только предупреждения и ошибки")
+    parser.add_argument("--log", metavar="PATH", help="записать подробный журнал в файл")
+    args = parser.parse_args(argv)
+    if args.cache_size < 1:
+        parser.error("--cache-size должен быть не меньше 1")
+    return args
+
+
+def main():
+    args = parse_args()
+    setup_logging(args)
+    server = RenderServer((args.host, args.port), args.templates, args.cache_size, args.engine)
+    logger.info(
+        "Сервис запущен: http://%s:%s/render, метрики — /metrics, шаблоны из %s. Выход — Ctrl+C",
+        args.host, server.server_address[1], server.templates_dir
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Сервис остановлен")
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Чтение файлов данных: оформление значений по источнику (Excel, CSV, JSONL)
+и определение кодировки CSV.
+"""
+import sys
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from WordGenFromExcel import read_row_tasks, _detect_csv_encoding  # noqa: E402
+
+HEADERS = ['Названия файлов', '{{Дата}}', '{{Текст}}']
+
+
+def read_rows(data_path):
+    headers, tasks = read_row_tasks(str(data_path), str(data_path.parent), '.docx')
+    assert headers == HEADERS
+    return [(Path(output_path).name, row_data) for _, output_path, row_data in tasks]
+
+
+def test_xlsx_text_that_looks_like_date_is_unchanged(tmp_path):
+    import openpyxl
+
+    wb = openpyxl.Workbook()
+    sheet = wb.active
+    sheet.append(HEADERS)
+    sheet.append(['2024-02-03', '2024-02-03', ' 2024-01-31T10:00 '])
+    sheet.append(['Договор', datetime(2024, 2, 3), ''])
+    data_path = tmp_path / 'Данные.xlsx'
+    wb.save(data_path)
+
+    assert read_rows(data_path) == [
+        ('2024-02-03.docx', ['2024-02-03', '2024-02-03', '2024-01-31T10:00']),
+        ('Договор.docx', ['Договор', '03.02.2024', '-']),
+    ]
+
+
+def test_csv_and_jsonl_iso_dates_are_formatted(tmp_path):
+    csv_path = tmp_path / 'Данные.csv'
+    csv_path.write_text(
+        'Названия файлов;{{Дата}};{{Текст}}\n'
+        'Договор;2024-02-03;текст\n'
+        'Акт;2024-01-31T10:00;2024-02-03\n',
+        encoding='utf-8'
+    )
+    jsonl_path = tmp_path / 'Данные.jsonl'
+    jsonl_path.write_text(
+        '{"Названия файлов": "Договор", "{{Дата}}": "2024-02-03", "{{Текст}}": "текст"}\n'
+        '{"Названия файлов": "Акт", "{{Дата}}": "2024-01-31T10:00", "{{Текст}}": "2024-02-03"}\n',
+        encoding='utf-8'
+    )
+    expected = [
+        ('Договор.docx', ['Договор', '03.02.2024', 'текст']),
+        # Первое значение столбца {{Текст}} не дата, поэтому дата в нём остаётся текстом
+        ('Акт.docx', ['Акт', '31.01.2024', '2024-02-03']),
+    ]
+    assert read_rows(csv_path) == expected
+    assert read_rows(jsonl_path) == expected
+
+
+def test_csv_encoding_checks_bytes_past_first_megabyte(tmp_path):
+    # Первый не-ASCII символ — после первого мегабайта, то есть во втором куске чтения
+    ascii_rows = b'doc;name\n' * (2 ** 20 // 9 + 1)
+    cp1251_path = tmp_path / 'cp1251.csv'
+    cp1251_path.write_bytes(ascii_rows + 'Договор;Иван\n'.encode('cp1251'))
+    assert _detect_csv_encoding(str(cp1251_path)) == 'cp1251'
+
+    utf8_path = tmp_path / 'utf8.csv'
+    utf8_path.write_bytes(ascii_rows + 'Договор;Иван\n'.encode('utf-8'))
+    assert _detect_csv_encoding(str(utf8_path)) == 'utf-8-sig'
+
+
+def test_csv_encoding_utf8_character_split_between_chunks(tmp_path):
+    # Двухбайтовый символ разрезан границей куска: это всё ещё UTF-8
+    path = tmp_path / 'utf8.csv'
+    path.write_bytes(b'x' * 1023 + 'Иван\n'.encode('utf-8'))
+    assert _detect_csv_encoding(str(path), chunk_size=1024) == 'utf-8-sig'
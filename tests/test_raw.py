@@ -0,0 +1,73 @@
+"""
+Быстрый режим (--engine raw): архив документа собирается из частей шаблона
+без повторного сжатия неизменных записей.
+"""
+import io
+import sys
+import zipfile
+from pathlib import Path
+
+import pytest
+from docx import Document
+from docx.shared import Inches
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import WordGenFromExcel  # noqa: E402
+from WordGenFromExcel import RawTemplate, get_document_text, open_docx  # noqa: E402
+from WordGenFromExcel_bench import make_png  # noqa: E402
+
+PLACEHOLDERS = ['{{Имя}}', '{{Сумма}}']
+VALUES = {'{{Имя}}': 'Иван', '{{Сумма}}': '100 & 200'}
+# Части шаблона, в которых есть плейсхолдеры
+FILLED_PARTS = {'word/document.xml', 'word/header1.xml'}
+
+
+@pytest.fixture
+def template_path(tmp_path):
+    doc = Document()
+    doc.add_paragraph('Договор с {{Имя}} на {{Сумма}}')
+    for seed in range(2):
+        doc.add_picture(io.BytesIO(make_png(64, 64, seed)), width=Inches(1))
+    doc.sections[0].header.paragraphs[0].text = 'Колонтитул {{Имя}}'
+    path = tmp_path / 'Шаблон.docx'
+    doc.save(path)
+    return str(path)
+
+
+def render(template_path):
+    output = io.BytesIO()
+    RawTemplate(template_path, PLACEHOLDERS).save(VALUES, output)
+    output.seek(0)
+    return output
+
+
+def check_document(output, template_path):
+    with zipfile.ZipFile(output) as z:
+        assert z.testzip() is None
+        infos = {info.filename: info for info in z.infolist()}
+        images = {name: z.read(name) for name in infos if name.startswith('word/media/')}
+    with zipfile.ZipFile(template_path) as z:
+        template_images = {name: z.read(name) for name in z.namelist() if name.startswith('word/media/')}
+    assert images == template_images and len(images) == 2
+
+    doc = open_docx(output)
+    text = get_document_text(doc)
+    assert 'Договор с Иван на 100 & 200' in text
+    assert 'Колонтитул Иван' in text
+    assert '{{' not in text
+    return infos
+
+
+def test_rewritten_parts_are_deflated(template_path):
+    infos = check_document(render(template_path), template_path)
+    assert FILLED_PARTS <= set(infos)
+    for name in FILLED_PARTS:
+        assert infos[name].compress_type == zipfile.ZIP_DEFLATED, name
+
+
+def test_without_zipfile_internals_members_are_recompressed(template_path, monkeypatch):
+    # Как в версии Python, где у ZipFile нет состояния, которое дописывает _write_raw_member()
+    monkeypatch.setattr(WordGenFromExcel, 'ZIPFILE_STATE', WordGenFromExcel.ZIPFILE_STATE + ('no_such_state',))
+    infos = check_document(render(template_path), template_path)
+    for name in FILLED_PARTS:
+        assert infos[name].compress_type == zipfile.ZIP_DEFLATED, name
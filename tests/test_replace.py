@@ -0,0 +1,142 @@
+"""
+Разностная проверка replace_placeholders_in_paragraph(): результат на параграфах
+из нескольких run'ов сравнивается со старым алгоритмом, который заменял
+плейсхолдеры по одному и пересчитывал границы run'ов после каждой замены.
+"""
+import sys
+import random
+from pathlib import Path
+
+import pytest
+from docx import Document
+from docx.shared import Pt
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from WordGenFromExcel import compile_placeholders, replace_placeholders_in_paragraph  # noqa: E402
+
+PLACEHOLDERS = ['{{A}}', '{{B}}', '{{AB}}', '{{Имя}}', '{{Сумма прописью}}']
+FILLER = ['', ' ', 'текст ', 'Договор №', ', ', 'x', '{', '}', '{{', 'A}}']
+
+
+def reference_replace(paragraph, old_text, new_text):
+    """Старый алгоритм замены одного плейсхолдера (с сохранением хвоста run'а)"""
+    if not old_text or not paragraph.runs:
+        return
+    full_text = ''.join(run.text for run in paragraph.runs)
+    start_search = 0
+    while True:
+        pos = full_text.find(old_text, start_search)
+        if pos == -1:
+            break
+        end_pos = pos + len(old_text)
+        runs = paragraph.runs
+        current_offset = 0
+        affected_runs = []
+        for i, run in enumerate(runs):
+            run_len = len(run.text)
+            run_start = current_offset
+            run_end = current_offset + run_len
+            if not (run_end <= pos or run_start >= end_pos):
+                affected_runs.append((i, max(0, pos - run_start), min(run_len, end_pos - run_start)))
+            current_offset = run_end
+        first_idx = affected_runs[0][0]
+        last_idx = affected_runs[-1][0]
+        before = runs[first_idx].text[:affected_runs[0][1]]
+        after = runs[last_idx].text[affected_runs[-1][2]:]
+        if first_idx == last_idx:
+            runs[first_idx].text = before + new_text + after
+        else:
+            runs[first_idx].text = before + new_text
+            runs[last_idx].text = after
+        for idx in range(last_idx - 1, first_idx, -1):
+            paragraph._element.remove(runs[idx]._element)
+        full_text = ''.join(run.text for run in paragraph.runs)
+        start_search = pos + len(new_text)
+
+
+# Документ, в который добавляются параграфы проверок: открывать новый на каждый случай долго
+DOCUMENT = Document()
+
+
+def make_paragraph(pieces):
+    """Параграф с run'ами pieces; у каждого run свой размер шрифта, чтобы различать run'ы"""
+    paragraph = DOCUMENT.add_paragraph()
+    for size, text in enumerate(pieces, 8):
+        paragraph.add_run(text).font.size = Pt(size)
+    return paragraph
+
+
+def snapshot(paragraph):
+    return [(run.text, run.font.size) for run in paragraph.runs]
+
+
+def check(pieces, values):
+    """
+    Текст всегда равен однопроходной замене по полному тексту параграфа. Разбиение
+    на run'ы и их оформление совпадают со старым алгоритмом, если тот не нашёл
+    новых плейсхолдеров на стыке вставленного значения и соседнего текста
+    (новый алгоритм вставленные значения повторно не просматривает).
+    Возвращает True, если сравнение со старым алгоритмом выполнено.
+    """
+    pattern = compile_placeholders(list(values))
+    actual = make_paragraph(pieces)
+    replace_placeholders_in_paragraph(actual, pattern, values)
+    one_pass = pattern.sub(lambda match: values[match.group(0)], ''.join(pieces))
+    assert actual.text == one_pass, pieces
+
+    expected = make_paragraph(pieces)
+    # Длинные плейсхолдеры первыми, как в compile_placeholders()
+    for placeholder in sorted(values, key=len, reverse=True):
+        reference_replace(expected, placeholder, values[placeholder])
+    if expected.text != one_pass:
+        return False
+    assert snapshot(actual) == snapshot(expected), pieces
+    return True
+
+
+def split_randomly(rng, text):
+    """Режет текст на run'ы в случайных местах, в том числе пустые run'ы"""
+    cuts = sorted(rng.randint(0, len(text)) for _ in range(rng.randint(0, 6)))
+    bounds = [0] + cuts + [len(text)]
+    return [text[a:b] for a, b in zip(bounds, bounds[1:])]
+
+
+VALUES = {'{{A}}': 'Иван', '{{B}}': '', '{{AB}}': 'длинное значение', '{{Имя}}': 'Пётр',
+          '{{Сумма прописью}}': 'сто рублей'}
+
+
+@pytest.mark.parametrize('pieces', [
+    # Плейсхолдер внутри одного run'а, с текстом до и после
+    ['Уважаемый {{Имя}}, добрый день'],
+    # Плейсхолдер разрезан на несколько run'ов
+    ['Сумма: {{Сумма ', 'пропи', 'сью}} руб.'],
+    ['{', '{', 'A', '}', '}'],
+    # Соседние и повторяющиеся плейсхолдеры
+    ['{{A}}{{A}}{{B}}', '{{AB}}'],
+    ['{{A}', '}{{A}', '}{{A}}'],
+    # Пустые run'ы на границах и внутри плейсхолдера
+    ['', '{{Имя', '', '}}', ''],
+    ['текст', '', '{{B}}', '', 'хвост'],
+    # Без плейсхолдеров и почти-плейсхолдеры
+    ['просто текст'],
+    ['{{', 'A}', ' }}'],
+])
+def test_known_cases(pieces):
+    assert check(pieces, VALUES)
+
+
+def test_inserted_values_are_not_rescanned():
+    # Старый алгоритм после замены {{Имя}} пустой строкой нашёл бы на стыке новый {{A}}
+    values = dict(VALUES, **{'{{Имя}}': ''})
+    assert not check(['{{', '{{Имя}}', 'A}}'], values)
+
+
+def test_random_corpus():
+    rng = random.Random(20261017)
+    compared = 0
+    for _ in range(3000):
+        tokens = [rng.choice(PLACEHOLDERS + FILLER) for _ in range(rng.randint(1, 10))]
+        values = {ph: rng.choice(['', 'X', 'значение', 'очень длинное значение']) for ph in PLACEHOLDERS}
+        compared += check(split_randomly(rng, ''.join(tokens)), values)
+    # Повторный просмотр старым алгоритмом — редкость, почти весь корпус сравнивается по run'ам
+    assert compared > 2700
@@ -0,0 +1,56 @@
+"""
+Проверка сводок шардов (--merge-shards).
+"""
+import sys
+import json
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from WordGenFromExcel import merge_shard_summaries  # noqa: E402
+
+INPUTS = {'Договор.docx': '0' * 64, 'Данные.xlsx': '1' * 64}
+
+
+def write_summary(tmp_path, shard, count, sizes, rows):
+    summary = {
+        'shard': shard,
+        'shards': count,
+        'inputs': INPUTS,
+        'sizes': sizes,
+        'rows': {
+            str(row): {'document': f'doc_{row}.docx', 'status': 'created', 'error': None}
+            for row in rows
+        },
+    }
+    path = tmp_path / f'WordGenFromExcel.shard-{shard}-of-{count}.json'
+    path.write_text(json.dumps(summary, ensure_ascii=False), encoding='utf-8')
+    return str(path)
+
+
+def read_merged(path):
+    return json.loads(Path(path).read_text(encoding='utf-8'))
+
+
+def test_complete_set_of_shards(tmp_path):
+    paths = [
+        write_summary(tmp_path, 1, 2, [2, 1], [1, 3]),
+        write_summary(tmp_path, 2, 2, [2, 1], [2]),
+    ]
+    output_path = tmp_path / 'shards.json'
+    assert merge_shard_summaries(paths, str(output_path))
+    merged = read_merged(output_path)
+    assert merged['rows_total'] == merged['rows_done'] == 3
+    assert merged['problems'] == []
+
+
+def test_shard_from_different_count_is_reported(tmp_path):
+    # Шард 3/3 при первой сводке 2/2: раньше его размер искался в sizes[2] и падал IndexError
+    paths = [
+        write_summary(tmp_path, 2, 2, [2, 1], [2]),
+        write_summary(tmp_path, 3, 3, [1, 1, 1], [3]),
+    ]
+    output_path = tmp_path / 'shards.json'
+    assert not merge_shard_summaries(paths, str(output_path))
+    problems = read_merged(output_path)['problems']
+    assert any('шард 3/3 не входит в пакет из 2 шардов' in problem for problem in problems)
+    assert any(problem.startswith('нет сводок шардов: 1') for problem in problems)
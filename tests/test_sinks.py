@@ -0,0 +1,39 @@
+"""
+Сохранение документов: --merge собирает все документы в один файл.
+"""
+import sys
+from argparse import Namespace
+from pathlib import Path
+
+import pytest
+from docx import Document
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from WordGenFromExcel import MergedDocumentSink, make_sink  # noqa: E402
+
+PLACEHOLDERS = ['{{Имя}}', '{{Сумма}}']
+
+
+def make_template(tmp_path, header_text):
+    doc = Document()
+    doc.add_paragraph('Договор с {{Имя}} на {{Сумма}}')
+    doc.sections[0].header.paragraphs[0].text = header_text
+    path = tmp_path / 'Шаблон.docx'
+    doc.save(path)
+    return str(path)
+
+
+def merge_args(tmp_path):
+    return Namespace(zip=None, merge=str(tmp_path / 'Все.docx'))
+
+
+def test_merge_accepts_placeholders_in_body_only(tmp_path):
+    template_path = make_template(tmp_path, 'Колонтитул без значений')
+    sink = make_sink(merge_args(tmp_path), template_path=template_path, placeholders=PLACEHOLDERS)
+    assert isinstance(sink, MergedDocumentSink)
+
+
+def test_merge_rejects_placeholders_in_header(tmp_path):
+    template_path = make_template(tmp_path, 'Колонтитул {{Имя}}')
+    with pytest.raises(ValueError, match=r'\{\{Имя\}\}'):
+        make_sink(merge_args(tmp_path), template_path=template_path, placeholders=PLACEHOLDERS)